@@ -1,5 +1,6 @@
 import discord
 import asyncpg
+import asyncio
 import logging
 import traceback
 from logging.handlers import RotatingFileHandler
@@ -7,7 +8,13 @@ from discord.ext import commands
 from discord_slash import SlashCommand
 
 import bot_config
+from cogs.utils import history
+from cogs.utils.cluster import ClusterConfig
+from cogs.utils.cluster import ClusterLink
 from cogs.utils.config import Config
+from cogs.utils.migrations import migrate
+from cogs.utils.stats import AirtimeStats
+from cogs.utils.stats import StatsBuffer
 
 
 INTENTS = discord.Intents.none()
@@ -17,6 +24,10 @@ INTENTS.guilds = True
 INTENTS.guild_messages = True
 INTENTS.guild_reactions = True
 
+MIGRATIONS_DIR_PATH = './migrations'
+# How often cluster workers report their health to the launcher, in seconds
+CLUSTER_HEALTH_INTERVAL = 15
+
 INITIAL_COGS = (
     'cogs.admin',
     'cogs.music',
@@ -24,10 +35,12 @@ INITIAL_COGS = (
 )
 
 
-class BotClient(commands.Bot):
-    def __init__(self, **kwargs) -> None:
+class BotClient(commands.AutoShardedBot):
+    def __init__(self, cluster_id: int = None, cluster_connection=None, **kwargs) -> None:
         self.config = bot_config
 
+        # None lets Discord recommend the shard count
+        kwargs.setdefault('shard_count', getattr(self.config, 'SHARD_COUNT', None))
         super().__init__(
             intents=INTENTS,
             command_prefix=commands.when_mentioned_or('radio '),
@@ -43,7 +56,7 @@ class BotClient(commands.Bot):
         stream_handler = logging.StreamHandler()
         stream_handler.setFormatter(format)
         rotating_handler = RotatingFileHandler(
-                'radiobot.log',
+                'radiobot.log' if cluster_id is None else f'radiobot-cluster{cluster_id}.log',
                 encoding='utf-8',
                 mode='a',
                 maxBytes=2 * 1024 * 1024
@@ -52,13 +65,24 @@ class BotClient(commands.Bot):
         log.handlers = [stream_handler, rotating_handler]
         self.log = log
 
+        # Set when running as a worker of launcher.py
+        self.cluster = None
+        if cluster_connection:
+            self.cluster = ClusterLink(cluster_id, cluster_connection, loop=self.loop, log=log)
+            self.loop.create_task(self.cluster_health_loop())
+
         self.loop.create_task(self.connect_postgres())
 
-        self.blacklist = Config('blacklist.json')
+        self.blacklist = self.open_config('blacklist.json')
+        # Radio stats waiting to be written to the database
+        self.stats = StatsBuffer()
+        # Listening time per programme and track, waiting to be written
+        self.airtime = AirtimeStats()
 
         self.slash = SlashCommand(
             self,
-            sync_commands=True,
+            # The commands are global, one process is enough to sync them
+            sync_commands=not cluster_id,
             sync_on_cog_reload=True,
             override_type=True
         )
@@ -66,13 +90,58 @@ class BotClient(commands.Bot):
         self.load_initial_cogs()
 
     async def connect_postgres(self):
-        self.db = await asyncpg.create_pool(
+        db = await asyncpg.create_pool(
             **self.config.DATABASE_CREDENTIALS, command_timeout=60.0
         )
-        if self.db:
-            self.log.info("Database connected successfully.")
-        else:
-            self.log.critical("Database not connected!")
+        if not db:
+            return self.log.critical("Database not connected!")
+
+        try:
+            version = await migrate(db, MIGRATIONS_DIR_PATH, self.log)
+        except Exception:
+            await db.close()
+            return self.log.critical(
+                f"Database schema not up to date!\n{traceback.format_exc()}"
+            )
+
+        try:
+            await history.ensure_partitions(db)
+        except Exception:
+            # The stats history loop tries again, until then the hourly stats can't be written
+            self.log.error(traceback.format_exc())
+
+        # Set only now, so the cogs don't use an outdated schema
+        self.db = db
+        self.log.info(f"Database connected successfully. Schema version: {version}")
+
+    def open_config(self, name: str):
+        """ Opens a Config, shared through the leader when running as a cluster """
+        if not self.cluster:
+            return Config(name)
+
+        return ClusterConfig(Config(name, shared=True), self.cluster)
+
+    @property
+    def is_leader(self) -> bool:
+        """ If this process runs the scheduled jobs, always true without a cluster """
+        return self.cluster is None or self.cluster.is_leader
+
+    async def cluster_health_loop(self):
+        while not self.is_closed():
+            players = 0
+            if hasattr(self, 'lavalink'):
+                players = len(self.lavalink.player_manager.players)
+
+            self.cluster.send(
+                'health',
+                ready=self.is_ready(),
+                shards={shard_id: not shard.is_closed() for shard_id, shard in self.shards.items()},
+                guilds=len(self.guilds),
+                players=players,
+                latency=self.latency,
+                leader=self.is_leader
+            )
+            await asyncio.sleep(CLUSTER_HEALTH_INTERVAL)
 
     def load_initial_cogs(self):
         for cog in INITIAL_COGS:
@@ -83,7 +152,13 @@ class BotClient(commands.Bot):
                 self.log.critical(traceback.format_exc())
 
     async def on_ready(self):
-        self.log.info(f"Woohoo, we are live!. User: {self.user}")
+        self.log.info(f"Woohoo, we are live!. User: {self.user}, shards: {self.shard_count}")
+
+    async def on_shard_ready(self, shard_id):
+        self.log.info(f"Shard {shard_id} is ready.")
+
+    async def on_shard_disconnect(self, shard_id):
+        self.log.warning(f"Shard {shard_id} disconnected.")
 
     async def on_message(self, message):
         if message.author.bot:
@@ -131,6 +206,19 @@ class BotClient(commands.Bot):
         except KeyError:
             pass
 
+    async def close(self):
+        # This unloads the cogs too
+        await super().close()
+
+        # Don't lose the stats that were not written yet
+        if hasattr(self, 'db'):
+            try:
+                await self.stats.flush(self.db)
+                self.airtime.checkpoint()
+                await self.airtime.flush(self.db)
+            except Exception:
+                self.log.critical(traceback.format_exc())
+
     def run(self):
         super().run(self.config.BOT_AUTH_TOKEN, reconnect=True)
 
@@ -6,3 +6,21 @@ DATABASE_CREDENTIALS = {
 	"database": "radiobotdata",
 	"host": "127.0.0.1"
 }
+
+# New players go to the node with the lowest load and get moved, if their node goes down
+LAVALINK_NODES = [
+	{
+		"host": "127.0.0.1",
+		"port": 2333,
+		"password": "youshallnotpass",
+		"region": "eu",
+		"name": "default-node"
+	},
+]
+
+# Amount of gateway shards, None to use the amount recommended by Discord
+SHARD_COUNT = None
+
+# Processes started by launcher.py, each running a range of the shards.
+# None to use one per CPU core
+CLUSTER_COUNT = None
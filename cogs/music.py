@@ -15,17 +15,21 @@ Features:
     - Supports Stage channels
     - User participation activity stats
     - Slash commands
+    - Optional broadcast mode, where all servers hear the same station in sync
+    - Multiple stations with their own schedules, servers choose which one to listen to
 Requires:
     - Intents for guilds, members and voice states.
     - Lavalink set up and running
     - Lavalink.py (https://github.com/Devoxin/Lavalink.py/)
     - PostgreSQL database running with schema.sql set up for stats
+      (tables are created from ./migrations on start up)
     - asyncpg (pip install -U asyncpg)
     - discord_slash (temp., while discord.py does not support them)
       (pip install -U discord-py-slash-command)
     - ./jingles directory with jingle sound files
     - ./jingles/ subdirectories for jingles per programmes
     - ./playlists directory with playlist lists text files
+    - ./programmes.json with the radio programme schedule
     - Configuaration in this cog
 
 Jingles:
@@ -33,6 +37,20 @@ Regular jingles have to be stored in directory: ./jingles
 Radio programme jingle directories under ./jingles
 For example: .jingles/programme/
 
+Stations:
+Each station in STATIONS has its own programme schedule file, playlists
+and regular jingles. Its playlist files are kept in a subdirectory of
+./playlists and its regular jingles in a subdirectory of ./jingles, the
+first station can use the directories themselves.
+Servers and voice channels can subscribe to a station with the "stacija"
+and "kanalastacija" commands.
+
+Programmes:
+The radio programme schedule is stored in ./programmes.json as a list of
+programmes with title, description, playlists_file_name, jingles_directory
+and play_times, for example: ["Monday 23:00", "Tuesday 4:00"].
+It can be reloaded at runtime with the "reloadschedule" command.
+
 Playlists:
 Playlists have to be stored in text files under ./playlists
 directory.
@@ -46,6 +64,8 @@ https://github.com/Devoxin/Lavalink.py/blob/master/examples/music.py
 """
 import re
 import os
+import json
+import hashlib
 import discord
 import lavalink
 import asyncio
@@ -53,7 +73,8 @@ import random
 import math
 import time
 import typing
-from os.path import isfile
+import functools
+import traceback
 from os.path import join as path_join
 from dataclasses import dataclass
 from discord.ext import commands
@@ -62,9 +83,28 @@ from discord_slash import cog_ext
 from discord_slash import SlashContext
 
 from .utils import convertors
+from .utils import formats
+from .utils import history
+from .utils.jingles import JingleCatalog
+from .utils.leaderboard import Leaderboard
+from .utils.leaderboard import LeaderboardCache
+from .utils.listening import ListeningTracker
+from .utils.resolver import PlaylistResolver
+from .utils.rotation import Cooldown
+from .utils.rotation import Rotation
+from .utils.scheduler import ProgrammeScheduler
+from .utils.scheduler import ScheduleIndex
+from .utils.scheduler import ScheduleState
+from .utils.scheduler import minute_of_week
+from .utils.searchcache import SearchCache
+from .utils.station import Station
+from .utils.supervisor import PlayerHealth
+from .utils.topics import TopicUpdater
+from .utils.trackcache import TrackCache
 
 
 URL_REGX = re.compile(r'https?://(?:www\.)?.+')
+SEARCH_PREFIXES = ('ytsearch:', 'scsearch:')
 
 # Default user queue limit
 USER_QUEUE_REQUESTS_LIMIT = 6
@@ -78,6 +118,13 @@ SONG_PLAYER_MAX_LENGHT_MILIS = 600000
 # in auto queue until this amount of other tracks are played first. 
 # Note: You need all playlist lists to contain atleast this amount of tracks
 SONG_AUTO_QUEUE_PLAY_COOLDOWN = 50
+# The same, but in seconds since the track was played. 0 to disable.
+SONG_AUTO_QUEUE_PLAY_COOLDOWN_SECONDS = 0
+# Share the auto queue cooldown between all guilds
+SONG_AUTO_QUEUE_SHARED_COOLDOWN = False
+# Amount of auto queue tracks kept queued after the user requests,
+# so the next track is always ready when the current one ends
+AUTO_QUEUE_LOOKAHEAD = 2
 
 # Root folder for storing jingles
 RADIO_JINGLES_DIR_PATH = './jingles'
@@ -85,6 +132,48 @@ RADIO_JINGLES_DIR_PATH = './jingles'
 JINGLES_MIN_INTERVAL = 2
 # Max. tracks between jingle playbacks
 JINGLES_MAX_INTERVAL = 3
+# How often to look for added or changed jingle files, in seconds
+JINGLES_REFRESH_INTERVAL = 60
+# All players follow one shared station timeline, instead of each running its own auto queue.
+# User requests are played in between, after that the player joins the station again.
+BROADCAST_MODE = False
+# Don't join the station for just the last few seconds of a track
+BROADCAST_JOIN_MIN_SECONDS = 5
+# Max. concurrent stage channel topic edits
+STAGE_TOPIC_CONCURRENCY = 2
+# Stage channel topic edits per second, over all the channels
+STAGE_TOPIC_RATE = 1.0
+STAGE_TOPIC_BURST = 5
+# Discord allows only a couple of topic edits per channel in 10 minutes
+STAGE_TOPIC_CHANNEL_EDITS = 2
+STAGE_TOPIC_CHANNEL_PERIOD = 600
+# How many times to retry a failed topic edit
+STAGE_TOPIC_RETRIES = 3
+
+# How often each player is checked, in seconds
+PLAYER_SUPERVISE_INTERVAL = 1
+# Max. seconds for a single reconnect or playback operation of a player
+PLAYER_OPERATION_TIMEOUT = 10
+# Delay before repairing a player again, doubled after every failed repair, in seconds
+PLAYER_REPAIR_BASE_DELAY = 2
+PLAYER_REPAIR_MAX_DELAY = 120
+# Park the player after this many failed repairs in a row, for this many seconds
+PLAYER_PARK_AFTER_FAILURES = 8
+PLAYER_PARK_SECONDS = 1800
+
+# How often to write the buffered stats to the database, in seconds
+STATS_FLUSH_INTERVAL = 60
+# Write the stats earlier, if this many users have unwritten stats
+STATS_FLUSH_MAX_PENDING = 500
+# How often to roll up and prune the stats history, in seconds
+STATS_HISTORY_INTERVAL = 3600
+# Full months of hourly stats to keep, weekly and monthly rollups are kept longer
+STATS_HISTORY_HOURLY_MONTHS = 3
+STATS_HISTORY_WEEKLY_WEEKS = 104
+# How many users to show in the leaderboards
+LEADERBOARD_SIZE = 8
+# How long to keep the leaderboards and user stats before reading them again, in seconds
+LEADERBOARD_CACHE_SECONDS = 300
 
 # Directory for playlist text files
 PLAYLISTS_DIR_PATH = './playlists'
@@ -92,55 +181,92 @@ PLAYLISTS_DIR_PATH = './playlists'
 PLAYLIST_FILE_NAME_HIGH_PRIORITY = 'high-priority.txt'
 PLAYLIST_FILE_NAME_MEDIUM_PRIORITY = 'medium-priority.txt'
 PLAYLIST_FILE_NAME_LOW_PRIORITY = 'low-priority.txt'
+# Persistent store of already resolved playlist lines
+TRACK_CACHE_FILE_PATH = 'track_cache.db'
+# Used when bot_config has no LAVALINK_NODES
+DEFAULT_LAVALINK_NODES = (
+    {'host': '127.0.0.1', 'port': 2333, 'password': 'youshallnotpass', 'region': 'eu', 'name': 'default-node'},
+)
+# How often cluster followers read the playlists, while the leader is still resolving them
+CLUSTER_CATALOG_RETRY_SECONDS = 30
+# Max. amount of cached /play and /find search results
+SEARCH_CACHE_MAX_SIZE = 2000
+# How long to keep the search results, in seconds
+SEARCH_CACHE_SECONDS = 3600
+# How long to remember the searches that found nothing, in seconds
+SEARCH_CACHE_NO_MATCHES_SECONDS = 600
+# Max. concurrent Lavalink lookups while loading playlists
+PLAYLIST_RESOLVE_CONCURRENCY = 3
+# Max. Lavalink lookups per second while loading playlists.
+# The rate gets lowered automatically, when the lookups start failing.
+PLAYLIST_RESOLVE_RATE = 2.0
+PLAYLIST_RESOLVE_MIN_RATE = 0.25
+PLAYLIST_RESOLVE_BURST = 4
+# How many times to retry a failed lookup
+PLAYLIST_RESOLVE_RETRIES = 2
+# How many minutes before a programme starts to begin loading its playlist
+PROGRAMME_PREWARM_MINUTES = 15
+
+# Radio programme schedule
+PROGRAMMES_FILE_PATH = './programmes.json'
+# Station name -> its programme schedule, playlists and regular jingles subdirectories
+# (under PLAYLISTS_DIR_PATH and RADIO_JINGLES_DIR_PATH, '' for the directories themselves).
+# Guilds listen to the first station, unless they subscribe to another one.
+STATIONS = {
+    'radio': {
+        'programmes_file_path': PROGRAMMES_FILE_PATH,
+        'playlists_directory': '',
+        'jingles_directory': ''
+    },
+}
+# Guild and voice channel id -> name of the station they subscribed to
+STATION_ASSIGNMENTS_FILE_PATH = 'stations.json'
 
 # Information when no programme is currently active
 NO_PROGRAMME_TITLE = "Parastā dziesmu rotācija"
 NO_PROGRAMME_DESCRIPTION = "Galvenais radio playlist. \ud83d\udd04"
 
 
-class ProgrammePlayTime:
+def normalize_query(query: str) -> str:
+    # Remove leading and trailing <> and fold the whitespace,
+    # so the same search always maps to the same cache entry.
+    query = ' '.join(query.strip().strip('<>').split())
 
-    __slots__ = ('start_time', 'end_time')
+    if not URL_REGX.match(query) and not query.startswith(SEARCH_PREFIXES):
+        query = f'ytsearch:{query}'
 
-    def __init__(self, start_time, end_time) -> None:
-        self.start_time = time.strptime(start_time, "%A %H:%M")
-        self.end_time = time.strptime(end_time, "%A %H:%M")
+    return query
 
-    def convert_time(self, tm) -> tuple:
-        # Converts this to easily comparable tuple
-        return tm.tm_wday, tm.tm_min + tm.tm_hour * 60
 
-    def is_now(self) -> bool:
-        start_time = self.convert_time(self.start_time)
-        end_time = self.convert_time(self.end_time)
-        now = self.convert_time(time.localtime())
+def normalize_search_query(query: str) -> str:
+    # Searches are case insensitive, URLs are not
+    query = normalize_query(query)
+    if query.startswith(SEARCH_PREFIXES):
+        prefix, _, text = query.partition(':')
+        query = f'{prefix}:{text.casefold()}'
 
-        if start_time < end_time:
-            if start_time <= now < end_time:
-                return True
-        elif start_time > end_time:
-            if now >= start_time or now < end_time:
-                return True
-        elif start_time == now == end_time:
-            return True
+    return query
 
-        return False
 
-    def occurs_next(self) -> int:
-        start_time = self.convert_time(self.start_time)
-        now = self.convert_time(time.localtime())
+class ProgrammePlayTime:
 
-        if start_time > now:
-            day_mins = (start_time[0] - now[0]) * 1440 # 1440 minutes per day
-            
-            return  day_mins + (start_time[1] - now[1])
-        elif start_time < now:
-            # Shift start day by 7 days
-            day_mins = (start_time[0] + 7 - now[0]) * 1440 # 1440 minutes per day
+    __slots__ = ('start_time', 'end_time', 'start_minute', 'end_minute')
 
-            return  day_mins + (start_time[1] - now[1])
-        else:
-            return 0
+    def __init__(self, start_time, end_time) -> None:
+        self.start_time = time.strptime(start_time, "%A %H:%M")
+        self.end_time = time.strptime(end_time, "%A %H:%M")
+        # Precomputed minutes of the week, for cheap comparisons
+        self.start_minute = minute_of_week(self.start_time)
+        self.end_minute = minute_of_week(self.end_time)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ProgrammePlayTime):
+            return NotImplemented
+
+        return (self.start_minute, self.end_minute) == (other.start_minute, other.end_minute)
+
+    def __hash__(self) -> int:
+        return hash((self.start_minute, self.end_minute))
 
 
 @dataclass
@@ -154,183 +280,125 @@ class RadioProgramme:
     playlists_file_name: str
     jingles_diretory: str
 
-    def should_be_active(self) -> typing.Union[bool, ProgrammePlayTime]:
-        for play_time in self.play_times:
-            if play_time.is_now():
-                return play_time
 
-        return False
+def load_programmes(path: str) -> tuple:
+    """ Loads the radio programmes and their compiled index. Raises ValueError, if the schedule is invalid. """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if not isinstance(data, list):
+        raise ValueError("The schedule has to be a list of programmes")
+
+    programmes = []
+    for index, entry in enumerate(data, start=1):
+        try:
+            programme = RadioProgramme(
+                play_times=[ProgrammePlayTime(start, end) for start, end in entry['play_times']],
+                title=str(entry['title']),
+                description=str(entry['description']),
+                playlists_file_name=str(entry['playlists_file_name']),
+                jingles_diretory=entry.get('jingles_directory') or None
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Programme #{index} is invalid: {e!r}") from e
+
+        if not programme.play_times:
+            raise ValueError(f"Programme {programme.title} has no play times")
+
+        programmes.append(programme)
+
+    titles = [prog.title for prog in programmes]
+    if len(set(titles)) != len(titles):
+        raise ValueError("Programme titles have to be unique")
+
+    programmes = tuple(programmes)
+    # Raises ValueError, if any of the play times overlap
+    return programmes, ScheduleIndex(programmes)
 
 
 class Music(commands.Cog):
     def __init__(self, bot) -> None:
         super().__init__()
         self.bot = bot
-        # If we are currently loading some auto queue tracks
-        self.loading_tracks = False
-        self.bot.loop.create_task(self.attach_lavalink())
-        
-        self.all_programmes = (
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Monday 12:00", "Monday 14:00"),
-                    ProgrammePlayTime("Tuesday 12:00", "Tuesday 14:00"),
-                    ProgrammePlayTime("Wednesday 12:00", "Wednesday 14:00"),
-                    ProgrammePlayTime("Thursday 12:00", "Thursday 14:00"),
-                    ProgrammePlayTime("Friday 12:00", "Friday 14:00"),
-                    ProgrammePlayTime("Saturday 12:00", "Saturday 14:00"),
-                    ProgrammePlayTime("Sunday 12:00", "Sunday 14:00")
-                ],
-                title="Tikai hiti",
-                description="Klausies tikai un vienīgi pašlaik vispopulārāko mūziku \ud83d\udd1d",
-                playlists_file_name="hits.txt",
-                jingles_diretory="hits"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Monday 23:00", "Tuesday 4:00"),
-                    ProgrammePlayTime("Tuesday 23:00", "Wednesday 4:00"),
-                    ProgrammePlayTime("Wednesday 23:00", "Thursday 4:00"),
-                    ProgrammePlayTime("Thursday 23:00", "Friday 4:00"),
-                    ProgrammePlayTime("Sunday 23:00", "Monday 4:00")
-                ],
-                title="Chillout bītu vakars",
-                description="Atpūties. Nomierinoša mūzika tavam darba dienas vakaram \ud83d\ude34",
-                playlists_file_name="chill.txt",
-                jingles_diretory="chill"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Monday 9:30", "Monday 11:00"),
-                    ProgrammePlayTime("Wednesday 9:30", "Wednesday 11:00"),
-                    ProgrammePlayTime("Friday 9:30", "Friday 11:00"),
-                    ProgrammePlayTime("Sunday 16:00", "Sunday 18:00")
-                ],
-                title="Throwback / Nostalģija",
-                description="Mūzika, kura nekad nenovecos, nu, vismaz pagaidām nē \ud83d\udc74",
-                playlists_file_name="throwback.txt",
-                jingles_diretory="throwback"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Tuesday 9:30", "Tuesday 11:00"),
-                    ProgrammePlayTime("Thursday 9:30", "Thursday 11:00"),
-                    ProgrammePlayTime("Saturday 16:00", "Saturday 18:00")
-                ],
-                title="Disko mašīna",
-                description="Mūzika no 70., 80., 90. gadiem - deju grīda ir tava \ud83d\udd7a",
-                playlists_file_name="disco.txt",
-                jingles_diretory="disco"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Monday 19:00", "Monday 20:30"),
-                    ProgrammePlayTime("Thursday 19:00", "Thursday 20:30")
-                ],
-                title="General special: slowed+reverb",
-                description="General īpašā programma: slowed+reverb edition \ud83d\udd25",
-                playlists_file_name="slowed.txt",
-                jingles_diretory="special"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Tuesday 19:00", "Tuesday 20:30"),
-                    ProgrammePlayTime("Friday 19:00", "Friday 20:30")
-                ],
-                title="General special: Phonk",
-                description="General īpašā programma: Phonk edition \ud83d\udd25",
-                playlists_file_name="phonk.txt",
-                jingles_diretory="special"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Friday 22:00", "Saturday 6:00"),
-                    ProgrammePlayTime("Saturday 22:00", "Sunday 6:00")
-                ],
-                title="Party Mix",
-                description="Tava nedēļas nogales ballīte ir šeit \ud83e\udd73",
-                playlists_file_name="party.txt",
-                jingles_diretory="party"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Saturday 8:00", "Saturday 11:00"),
-                    ProgrammePlayTime("Sunday 8:00", "Sunday 11:00")
-                ],
-                title="Celies augšā!",
-                description="Nav ko gulēt brīvdienās - enerģiska mūzika, lai pamostos \ud83e\udd29",
-                playlists_file_name="energy.txt",
-                jingles_diretory="energy"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Wednesday 19:00", "Wednesday 21:00")
-                ],
-                title="Latviešu mūzikas trešdienas",
-                description="Klausamies vietējo mūziku \ud83c\uddf1\ud83c\uddfb",
-                playlists_file_name="latvian.txt",
-                jingles_diretory="latvian"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Monday 16:00", "Monday 17:00")
-                ],
-                title="Dienas skaņa: Indie",
-                description="TIkai un vienīgi indie mūzika \ud83c\udfd5\ufe0f",
-                playlists_file_name="indie.txt",
-                jingles_diretory="genre"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Tuesday 16:00", "Tuesday 17:00")
-                ],
-                title="Dienas skaņa: Rock/Metal",
-                description="TIkai un vienīgi rokmūzika/metāls \ud83c\udfb8",
-                playlists_file_name="rock.txt",
-                jingles_diretory="genre"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Wednesday 16:00", "Wednesday 17:00")
-                ],
-                title="Dienas skaņa: Hip Hop",
-                description="TIkai un vienīgi hip hops/reps \ud83c\udf99\ufe0f",
-                playlists_file_name="hiphop.txt",
-                jingles_diretory="genre"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Thursday 16:00", "Thursday 17:00")
-                ],
-                title="Dienas skaņa: Jazz",
-                description="TIkai un vienīgi džezs \ud83c\udfb7",
-                playlists_file_name="jazz.txt",
-                jingles_diretory="genre"
-            ),
-            RadioProgramme(
-                play_times = [
-                    ProgrammePlayTime("Friday 16:00", "Friday 17:00")
-                ],
-                title="Dienas skaņa: EDM",
-                description="TIkai un vienīgi elektroniskā deju mūzika \ud83d\udc6f",
-                playlists_file_name="edm.txt",
-                jingles_diretory="genre"
+        # Node name -> track lookups in progress
+        self.node_lookups = {}
+        # Guild id -> task supervising its player
+        self.player_tasks = {}
+        # Guild id -> health of its player
+        self.player_health = {}
+
+        # This ensures the cache isn't reopened during cog reloads.
+        if not hasattr(self.bot, 'track_cache'):
+            self.bot.track_cache = TrackCache(TRACK_CACHE_FILE_PATH, loop=self.bot.loop)
+        self.track_cache = self.bot.track_cache
+        # Shared by all guilds
+        if not hasattr(self.bot, 'search_cache'):
+            self.bot.search_cache = SearchCache(
+                SEARCH_CACHE_MAX_SIZE, SEARCH_CACHE_SECONDS, SEARCH_CACHE_NO_MATCHES_SECONDS
             )
+        self.search_cache = self.bot.search_cache
+        self.resolver = PlaylistResolver(
+            concurrency=PLAYLIST_RESOLVE_CONCURRENCY,
+            rate=PLAYLIST_RESOLVE_RATE,
+            burst=PLAYLIST_RESOLVE_BURST,
+            min_rate=PLAYLIST_RESOLVE_MIN_RATE,
+            retries=PLAYLIST_RESOLVE_RETRIES
         )
+        # Playlist key -> (fingerprint, lines) of the file loaded last time
+        # and the resolved tracks of the lines, shared by the stations
+        self.playlist_lines = {}
+        # Playlist key -> (title, reason) of the tracks left out of auto queue
+        self.ineligible_tracks = {}
+
+        # Raises ValueError, if any of the schedules is invalid
+        self.stations = {name: self.create_station(name, **options) for name, options in STATIONS.items()}
+        self.default_station = next(iter(self.stations.values()))
+        # This ensures the assignments aren't reloaded during cog reloads.
+        if not hasattr(self.bot, 'station_assignments'):
+            self.bot.station_assignments = self.bot.open_config(STATION_ASSIGNMENTS_FILE_PATH)
+        self.station_assignments = self.bot.station_assignments
+        self.bot.loop.create_task(self.attach_lavalink())
 
-        # Current programme and current playtime for programme
-        self.programme, self.programme_play_time = None, None
-        # Next up
-        self.nearest_programme, self.nearest_play_time = None, None
-        
-        # Here we store the loaded Lavalink.py track objects
-        self.tracks_programme = []
-        self.tracks_low = []
-        self.tracks_medium = []
-        self.tracks_high = []
+        self.jingles = JingleCatalog(RADIO_JINGLES_DIR_PATH, loop=self.bot.loop)
+        # Stage channel topic edits, written outside of the radio loop
+        self.topics = TopicUpdater(
+            self.edit_stage_channel_topic,
+            concurrency=STAGE_TOPIC_CONCURRENCY,
+            rate=STAGE_TOPIC_RATE,
+            burst=STAGE_TOPIC_BURST,
+            channel_edits=STAGE_TOPIC_CHANNEL_EDITS,
+            channel_period=STAGE_TOPIC_CHANNEL_PERIOD,
+            retries=STAGE_TOPIC_RETRIES,
+            log=self.bot.log,
+            loop=self.bot.loop
+        )
+        self.topics.start()
+        # If we are currently writing the buffered stats, and the task writing them
+        self.stats_flushing = False
+        self.stats_flush_task = None
+        self.leaderboards = LeaderboardCache(LEADERBOARD_CACHE_SECONDS)
+
+        # Listening sessions of the members, updated from voice states
+        self.listening = ListeningTracker()
+        if self.bot.is_ready():
+            # The cog was reloaded
+            for guild in self.bot.guilds:
+                self.sync_guild_listeners(guild)
+
+        if self.bot.cluster:
+            # The leader runs the schedule and writes the stats and the catalog for the cluster
+            self.bot.cluster.set_handler('leader', self.on_cluster_leader)
+            self.bot.cluster.set_handler('schedule', self.on_cluster_schedule)
+            self.bot.cluster.set_handler('schedule_sync', self.on_cluster_schedule_sync)
+            self.bot.cluster.set_handler('stats', self.on_cluster_stats)
+            self.bot.cluster.set_handler('catalog', self.on_cluster_catalog)
+            self.bot.cluster.set_handler('on_air', self.on_cluster_on_air)
+            self.bot.cluster.set_handler('reload', self.on_cluster_reload)
 
         self.radio_loop.start()
-        self.radio_stats_minutes_loop.start()
+        self.jingles_refresh_loop.start()
+        self.stats_flush_loop.start()
+        self.stats_history_loop.start()
 
 
     @staticmethod
@@ -370,85 +438,461 @@ class Music(commands.Cog):
 
         # This ensures the client isn't overwritten during cog reloads.
         if not hasattr(self.bot, 'lavalink'):
-            self.bot.lavalink = lavalink.Client(self.bot.user.id)
-            # Host, Port, Password, Region, Name
-            self.bot.lavalink.add_node('127.0.0.1', 2333, 'youshallnotpass', 'eu', 'default-node')
+            self.bot.lavalink = lavalink.Client(self.bot.user.id, shard_count=self.bot.shard_count or 1)
+            # New players are placed on the node with the lowest penalty,
+            # preferring the nodes in the voice region of the guild.
+            for node in getattr(self.bot.config, 'LAVALINK_NODES', DEFAULT_LAVALINK_NODES):
+                self.bot.lavalink.add_node(**node)
             self.bot.add_listener(self.bot.lavalink.voice_update_handler, 'on_socket_response')
 
         self.bot.lavalink.add_event_hook(self.track_hook)
+        for station in self.stations.values():
+            if BROADCAST_MODE:
+                station.broadcast_task = self.bot.loop.create_task(self.broadcast_loop(station))
+            if self.bot.is_leader:
+                station.scheduler.start()
+
+        if not self.bot.is_leader:
+            self.bot.cluster.send_to_leader('schedule_sync')
+
+    def create_station(self, name: str, **options) -> Station:
+        station = Station(name, create_cooldown=self.create_auto_queue_cooldown, **options)
+        # Raises ValueError, if the schedule is invalid
+        station.all_programmes, station.schedule_index = load_programmes(station.programmes_file_path)
+        station.scheduler = ProgrammeScheduler(
+            functools.partial(self.find_schedule_state, station),
+            on_update=functools.partial(self.on_schedule_update, station),
+            on_start=functools.partial(self.on_programme_start, station),
+            on_end=functools.partial(self.on_programme_end, station),
+            lead_time=PROGRAMME_PREWARM_MINUTES * 60,
+            log=self.bot.log,
+            loop=self.bot.loop
+        )
+
+        return station
+
+    def get_station(self, guild_id: int, channel_id: int = None) -> Station:
+        """ The station of the voice channel, or else of the guild """
+        name = self.station_assignments.get(channel_id) if channel_id else None
+        if not name:
+            name = self.station_assignments.get(guild_id)
+
+        return self.stations.get(name, self.default_station)
+
+    def get_player_station(self, player: lavalink.BasePlayer) -> Station:
+        channel_id = player.channel_id or player.fetch(key=f'chan:{player.guild_id}', default=0)
+        return self.get_station(int(player.guild_id), int(channel_id) if channel_id else None)
+
+    def get_station_players(self, station: Station) -> list:
+        return [
+            player for player in self.bot.lavalink.player_manager.find_all()
+            if self.get_player_station(player) is station
+        ]
+
+    def find_best_node(self) -> lavalink.Node:
+        # The penalties come with the node stats once a minute,
+        # so also count the players placed on them meanwhile.
+        return min(
+            self.bot.lavalink.node_manager.available_nodes,
+            key=lambda node: node.penalty + len(node.players)
+        )
+
+    async def move_player(self, player: lavalink.DefaultPlayer) -> None:
+        """ Moves the player to the best available node, resuming the current track at its position """
+        old_node, node = player.node, self.find_best_node()
+        if node is old_node:
+            return
+
+        try:
+            await player.change_node(node)
+        except Exception:
+            return self.bot.log.error(traceback.format_exc())
+
+        self.bot.log.info(f"Moved player {player.guild_id} from node {old_node.name} to {node.name}")
+
+    async def get_tracks(self, query: str) -> dict:
+        """ Looks up the query on the least busy node, so loading spreads across all nodes """
+        nodes = self.bot.lavalink.node_manager.available_nodes
+        if not nodes:
+            # Raises NodeException
+            return await self.bot.lavalink.get_tracks(query)
+
+        node = min(nodes, key=lambda node: (self.node_lookups.get(node.name, 0), node.penalty))
+        self.node_lookups[node.name] = self.node_lookups.get(node.name, 0) + 1
+        try:
+            return await self.bot.lavalink.get_tracks(query, node=node)
+        finally:
+            self.node_lookups[node.name] -= 1
+
+    def choose_jingle(self, station: Station) -> typing.Optional[dict]:
+        jingle = None
+        if station.programme and station.programme.jingles_diretory:
+            jingle = self.jingles.choose(station.programme.jingles_diretory)
+
+        if not jingle:
+            jingle = self.jingles.choose(station.jingles_directory)
+
+        return jingle
+
+    def queue_jingle(self, player) -> bool:
+        jingle = self.choose_jingle(self.get_player_station(player))
+        if not jingle:
+            return False
+
+        player.add(requester=self.bot.user.id, track=jingle, index=0)
+        return True
+
+    @staticmethod
+    def read_playlist_file(filename: str, loaded: tuple = None) -> tuple:
+        """ Returns the fingerprint and the queries of the file, ``loaded`` ones if it has not changed """
+        path = path_join(PLAYLISTS_DIR_PATH, filename)
+
+        with open(path, 'rb') as playl:
+            content = playl.read()
 
-    async def load_jingle(self, player) -> None:
-        if self.programme and self.programme.jingles_diretory:
-            file_name = random.choice(os.listdir(path_join(RADIO_JINGLES_DIR_PATH, self.programme.jingles_diretory)))
-            path = path_join(RADIO_JINGLES_DIR_PATH, self.programme.jingles_diretory, str(file_name))
+        fingerprint = (os.path.getmtime(path), hashlib.sha1(content).hexdigest())
+        if loaded and loaded[0] == fingerprint:
+            return loaded
+
+        queries = []
+        for line in content.decode('utf-8').splitlines():
+            # Allow commenting
+            if not line.startswith('#') and line.strip():
+                queries.append(normalize_query(line))
+
+        return fingerprint, queries
+
+    @staticmethod
+    def get_ineligible_reason(track: dict) -> typing.Optional[str]:
+        if track['info']['isStream']:
+            return 'stream'
+
+        if track['info']['length'] > SONG_PLAYER_MAX_LENGHT_MILIS:
+            return 'too long'
+
+        return None
+
+    @staticmethod
+    def remove_tier_duplicates(*tiers) -> list:
+        """ Keeps every track only in the first (highest priority) list it appears in """
+        seen, result = set(), []
+        for tracks in tiers:
+            unique = []
+            for track in tracks:
+                if track['info']['identifier'] not in seen:
+                    seen.add(track['info']['identifier'])
+                    unique.append(track)
+
+            result.append(unique)
+
+        return result
+
+    async def load_playlist_from_file(self, filename: str, to_list: list) -> None:
+        loaded = self.playlist_lines.get(filename)
+        if loaded:
+            # Not parsed again, if the file has not changed since
+            loaded_file, known = loaded
+            cached_fingerprint = loaded_file[0]
+            fingerprint, queries = self.read_playlist_file(filename, loaded_file)
         else:
-            # The jingle folder has subdirectories for programme jingles
-            only_files = [f for f in os.listdir(RADIO_JINGLES_DIR_PATH) if isfile(path_join(RADIO_JINGLES_DIR_PATH, f))]
-            file_name = random.choice(only_files)
-            path = path_join(RADIO_JINGLES_DIR_PATH, str(file_name))
+            fingerprint, queries = self.read_playlist_file(filename)
+            cached_fingerprint, known = await self.track_cache.get_playlist(filename)
+
+        # Tracks that can't be played in auto queue are left out and reported
+        ineligible = self.ineligible_tracks[filename] = []
+        seen = {track['info']['identifier'] for track in to_list}
+
+        def add_tracks(tracks: list) -> None:
+            for track in tracks:
+                reason = self.get_ineligible_reason(track)
+                if reason:
+                    ineligible.append((track['info']['title'], reason))
+                elif track['info']['identifier'] not in seen:
+                    # Duplicates would make the track more likely to be chosen
+                    seen.add(track['info']['identifier'])
+                    to_list.append(track)
+
+        # The same line can be listed multiple times
+        lines = dict.fromkeys(queries)
+        resolved, missing = {}, []
+        for query in lines:
+            if query in known:
+                resolved[query] = known[query]
+                add_tracks(known[query])
+            else:
+                missing.append(query)
 
-        result = await player.node.get_tracks(path)
-        tracks = result['tracks']
-        if tracks:
-            player.add(requester=self.bot.user.id, track=tracks[0], index=0)
+        async def on_resolved(query: str, tracks: typing.Optional[list]) -> None:
+            # Failed lookups are not remembered, so they get retried next time
+            if tracks is None:
+                return
 
-    async def load_playlist(self, player, query: str, to_list: list) -> None:
-        query = query.strip('<>')
+            resolved[query] = tracks
+            # Make the track playable right away
+            add_tracks(tracks)
+            await self.track_cache.put_line(filename, query, tracks)
+
+        # In a cluster, only the leader resolves the new lines and lets the others know
+        to_resolve = missing if self.bot.is_leader else []
+        await self.resolver.resolve(filename, to_resolve, self.get_tracks, on_resolved, len(resolved))
+        self.playlist_lines[filename] = ((fingerprint, queries), resolved)
+
+        # Forget the lines that were removed from the file since the last load
+        changed = cached_fingerprint != fingerprint or known.keys() != resolved.keys()
+        if changed and self.bot.is_leader:
+            await self.track_cache.put_playlist(filename, fingerprint, resolved)
+            if self.bot.cluster:
+                self.bot.cluster.broadcast('catalog', file_name=filename)
+
+        progress = self.resolver.progress[filename]
+        self.bot.log.info(
+            f"Loaded playlist {filename}: {progress.resolved} lines resolved, {progress.failed} failed "
+            f"({len(missing)} new, {len(known.keys() - lines.keys())} removed), "
+            f"{len(to_list)} tracks playable, {len(ineligible)} not"
+        )
 
-        if not URL_REGX.match(query):
-            query = f'ytsearch:{query}'
+    async def load_programme_playlist_from_file(self, station: Station, key: str, to_list: list) -> None:
+        try:
+            await self.load_playlist_from_file(key, to_list)
+        finally:
+            # Allow the radio loop to try again, if nothing got loaded
+            if not to_list and station.programme_tracks.get(key) is to_list:
+                del station.programme_tracks[key]
+
+    def get_programme_tracks(self, station: Station, programme: RadioProgramme) -> list:
+        """ Returns the track list of a programme and starts loading it, if it is not loaded yet """
+        key = station.playlist_key(programme.playlists_file_name)
+        tracks = station.programme_tracks.get(key)
+        if tracks is None:
+            tracks = station.programme_tracks[key] = []
+            self.bot.loop.create_task(self.load_programme_playlist_from_file(station, key, tracks))
+
+        return tracks
+
+    def prewarm_next_programme(self, station: Station) -> None:
+        if not station.nearest_programme or not self.bot.lavalink.node_manager.available_nodes:
+            return
+
+        if station.playlist_key(station.nearest_programme.playlists_file_name) not in station.programme_tracks:
+            self.bot.log.info(f"Loading playlist for upcoming programme {station.nearest_programme.title}")
+            self.get_programme_tracks(station, station.nearest_programme)
 
-        # Get the results for the query from Lavalink.
-        results = await player.node.get_tracks(query)
+    @staticmethod
+    def get_default_playlist_keys(station: Station) -> tuple:
+        return tuple(
+            station.playlist_key(filename)
+            for filename in (PLAYLIST_FILE_NAME_HIGH_PRIORITY, PLAYLIST_FILE_NAME_MEDIUM_PRIORITY, PLAYLIST_FILE_NAME_LOW_PRIORITY)
+        )
 
-        tracks = results['tracks']
-        to_list.extend(tracks)
+    async def load_all_playlists_from_files(self, station: Station) -> None:
+        high, medium, low = self.get_default_playlist_keys(station)
 
-    async def load_playlist_from_file(self, player, filename: str, to_list: list) -> None:
-        self.loading_tracks = True
-        
-        with open(PLAYLISTS_DIR_PATH + '/' + filename, 'r') as playl:
-            for line in playl.readlines():
-                # Allow commenting
-                if not line.startswith('#') and line != '\n':
-                    await self.load_playlist(player, line.replace('\n', ''), to_list)
+        station.loading_tracks = True
+        try:
+            # Each of the lists is playable as soon as its first tracks are resolved
+            await asyncio.gather(
+                self.load_playlist_from_file(high, station.tracks_high),
+                self.load_playlist_from_file(medium, station.tracks_medium),
+                self.load_playlist_from_file(low, station.tracks_low)
+            )
+
+            station.tracks_high, station.tracks_medium, station.tracks_low = self.remove_tier_duplicates(
+                station.tracks_high, station.tracks_medium, station.tracks_low
+            )
+        finally:
+            station.loading_tracks = False
+
+    async def reload_playlists(self, station: Station) -> None:
+        # The new lists are built aside, while the old ones keep playing.
+        # Only the lines added to the files since the last load get resolved.
+        high, medium, low = self.get_default_playlist_keys(station)
+        tracks_high, tracks_medium, tracks_low, tracks_programme = [], [], [], []
+        loads = [
+            self.load_playlist_from_file(high, tracks_high),
+            self.load_playlist_from_file(medium, tracks_medium),
+            self.load_playlist_from_file(low, tracks_low)
+        ]
+        programme = station.programme
+        if programme:
+            programme_key = station.playlist_key(programme.playlists_file_name)
+            loads.append(self.load_playlist_from_file(programme_key, tracks_programme))
+
+        station.loading_tracks = True
+        try:
+            await asyncio.gather(*loads)
+        finally:
+            station.loading_tracks = False
+
+        station.tracks_high, station.tracks_medium, station.tracks_low = self.remove_tier_duplicates(
+            tracks_high, tracks_medium, tracks_low
+        )
+        # The programme could have ended while we were loading
+        if programme and programme is station.programme:
+            station.tracks_programme = tracks_programme
+            station.programme_tracks[programme_key] = tracks_programme
+
+    async def reload_all_playlists(self) -> None:
+        await asyncio.gather(*(self.reload_playlists(station) for station in self.stations.values()))
+
+    def load_schedules(self) -> dict:
+        """ Reads the schedules of all stations, raises ValueError if any of them can't be read """
+        schedules = {}
+        for station in self.stations.values():
+            try:
+                schedules[station] = load_programmes(station.programmes_file_path)
+            except (OSError, ValueError) as e:
+                raise ValueError(f'Schedule of station {station.name} not reloaded: {e}') from e
+
+        return schedules
+
+    def apply_schedules(self, schedules: dict) -> None:
+        for station, (programmes, schedule_index) in schedules.items():
+            station.all_programmes, station.schedule_index = programmes, schedule_index
+
+            # Loaded programme playlists are kept, unless no programme uses them anymore
+            keys = {station.playlist_key(prog.playlists_file_name) for prog in programmes}
+            for key in station.programme_tracks.keys() - keys:
+                del station.programme_tracks[key]
+
+            station.scheduler.reschedule()
+            self.bot.log.info(f"Schedule of station {station.name} reloaded with {len(programmes)} programmes")
+
+    def find_schedule_state(self, station: Station) -> ScheduleState:
+        now = time.localtime()
+        minute = minute_of_week(now)
+        state = ScheduleState()
+
+        state.programme, state.play_time, ends_in = station.schedule_index.at(minute)
+        if state.programme:
+            # The boundaries are at the start of a minute
+            state.ends_in = ends_in * 60 - now.tm_sec
+
+        state.next_programme, state.next_play_time, starts_in = station.schedule_index.next(minute)
+        if state.next_programme:
+            state.next_starts_in = starts_in * 60 - now.tm_sec
 
-                    # Slow load - to lower the chance to get rate limited?
-                    await asyncio.sleep(random.randint(2, 4))
+        return state
 
-        self.loading_tracks = False
+    @staticmethod
+    def schedule_state_to_message(state: ScheduleState) -> dict:
+        def play_time_minutes(play_time):
+            return (play_time.start_minute, play_time.end_minute) if play_time else None
+
+        return {
+            'programme': state.programme.title if state.programme else None,
+            'play_time': play_time_minutes(state.play_time),
+            'next_programme': state.next_programme.title if state.next_programme else None,
+            'next_play_time': play_time_minutes(state.next_play_time),
+            'next_starts_in': state.next_starts_in,
+            'ends_in': state.ends_in
+        }
+
+    @staticmethod
+    def schedule_state_from_message(station: Station, message: dict) -> ScheduleState:
+        programmes = {prog.title: prog for prog in station.all_programmes}
+
+        def find(title, minutes):
+            prog = programmes.get(title)
+            if not prog:
+                return None, None
+
+            play_time = next((pt for pt in prog.play_times if (pt.start_minute, pt.end_minute) == tuple(minutes)), None)
+            return prog, play_time
+
+        state = ScheduleState(next_starts_in=message['next_starts_in'], ends_in=message['ends_in'])
+        if message['programme']:
+            state.programme, state.play_time = find(message['programme'], message['play_time'])
+        if message['next_programme']:
+            state.next_programme, state.next_play_time = find(message['next_programme'], message['next_play_time'])
+
+        return state
+
+    async def on_cluster_leader(self, message: dict) -> None:
+        if not hasattr(self.bot, 'lavalink'):
+            # attach_lavalink takes care of it
+            return
 
-    async def load_programme_playlist_from_file(self, player) -> None:
-        if not self.programme:
+        if self.bot.is_leader:
+            self.bot.log.info("This cluster is the leader now")
+            for station in self.stations.values():
+                station.scheduler.start()
+        else:
+            for station in self.stations.values():
+                station.scheduler.stop()
+            self.bot.cluster.send_to_leader('schedule_sync')
+
+    async def on_cluster_schedule(self, message: dict) -> None:
+        station = self.stations.get(message['station'])
+        if self.bot.is_leader or not hasattr(self.bot, 'lavalink') or not station:
             return
 
-        await self.load_playlist_from_file(player, self.programme.playlists_file_name, self.tracks_programme)
+        await station.scheduler.apply(self.schedule_state_from_message(station, message['state']))
 
-    async def load_all_playlists_from_files(self, player) -> None:
-        await self.load_playlist_from_file(player, PLAYLIST_FILE_NAME_HIGH_PRIORITY, self.tracks_high)
-        await self.load_playlist_from_file(player, PLAYLIST_FILE_NAME_MEDIUM_PRIORITY, self.tracks_medium)
-        await self.load_playlist_from_file(player, PLAYLIST_FILE_NAME_LOW_PRIORITY, self.tracks_low)
+    async def on_cluster_schedule_sync(self, message: dict) -> None:
+        if not self.bot.is_leader:
+            return
 
-    def find_next_programme_and_play_time(self) -> tuple:
-        nearest_prog, nearest_play_time = None, None
-        for prog in self.all_programmes:
-            for play_time in prog.play_times:
-                occurs_next = play_time.occurs_next()
-                if occurs_next == 0:
-                    # Not really next, it is current by now
-                    continue
+        for station in self.stations.values():
+            self.bot.cluster.broadcast(
+                'schedule', station=station.name, state=self.schedule_state_to_message(station.scheduler.state)
+            )
+            if station.broadcast.current:
+                self.bot.cluster.broadcast(
+                    'on_air', station=station.name, track=station.broadcast.current, position=station.broadcast.position()
+                )
 
-                if not nearest_prog:
-                    nearest_prog, nearest_play_time = prog, play_time
-                    continue
+    async def on_cluster_on_air(self, message: dict) -> None:
+        station = self.stations.get(message['station'])
+        if self.bot.is_leader or not BROADCAST_MODE or not station:
+            return
 
-                if occurs_next < nearest_play_time.occurs_next():
-                    nearest_prog, nearest_play_time = prog, play_time
+        station.broadcast.start(message['track'], message['position'])
+        await self.sync_broadcast_players(station)
 
-        return nearest_prog, nearest_play_time
+    async def on_cluster_reload(self, message: dict) -> None:
+        if message['what'] == 'playlists':
+            if any(station.loading_tracks for station in self.stations.values()):
+                self.bot.log.warning("Playlists not reloaded, they are still loading")
+                return
 
-    async def change_stage_channel_topic(self, guild_id: int):      
-        guild = await convertors.get_fetch_guild(self.bot, guild_id)
+            # The changed catalogs get broadcast while loading
+            await self.reload_all_playlists()
+            return
+
+        try:
+            schedules = self.load_schedules()
+        except ValueError:
+            self.bot.log.error(traceback.format_exc())
+            return
+
+        # Before the leader broadcasts the new schedule state
+        self.apply_schedules(schedules)
+        if self.bot.is_leader:
+            self.bot.cluster.broadcast('reload', what='schedule')
+
+    async def on_cluster_stats(self, message: dict) -> None:
+        # Written with our own stats
+        self.bot.stats.merge(message['stats'])
+        self.bot.airtime.merge(*message['airtime'])
+
+    async def on_cluster_catalog(self, message: dict) -> None:
+        key = message['file_name']
+        self.bot.log.info(f"Playlist {key} was updated by the leader")
+        # Read it from the track cache again
+        self.playlist_lines.pop(key, None)
+
+        # The same playlist can be used by several stations
+        for station in self.stations.values():
+            if key in self.get_default_playlist_keys(station):
+                while station.loading_tracks:
+                    await asyncio.sleep(1)
+                await self.reload_playlists(station)
+            else:
+                # Loaded again when needed
+                station.programme_tracks.pop(key, None)
+
+    def change_stage_channel_topic(self, station: Station, guild_id: int) -> None:
+        guild = self.bot.get_guild(guild_id)
         if not guild:
             return
 
@@ -460,190 +904,536 @@ class Music(commands.Cog):
         if not isinstance(channel, discord.StageChannel):
             return
 
-        if not self.programme:
+        if not station.programme:
             description = f"{NO_PROGRAMME_TITLE} \ud83d\udd04"
         else:
-            current_playtime = self.format_programme_playtime_to_string(self.programme_play_time)
-            description = f"{self.programme.title} \ud83d\udcfb {current_playtime}"
+            current_playtime = self.format_programme_playtime_to_string(station.programme_play_time)
+            description = f"{station.programme.title} \ud83d\udcfb {current_playtime}"
 
-        if channel.permissions_for(guild.me).manage_channels:
+        # Written in the background, unless the channel has this topic already
+        self.topics.update(channel.id, description)
+
+    def change_stage_channel_topics(self, station: Station, players: list) -> None:
+        for player in players:
+            self.change_stage_channel_topic(station, int(player.guild_id))
+
+    async def edit_stage_channel_topic(self, channel_id: int, topic: str) -> None:
+        channel = self.bot.get_channel(channel_id)
+        if not isinstance(channel, discord.StageChannel):
+            return
+
+        # We could have left the channel, while the edit was queued
+        me = channel.guild.me
+        if not me.voice or me.voice.channel != channel or not channel.permissions_for(me).manage_channels:
+            return
+
+        try:
             await channel.edit(
-                topic=description,
+                topic=topic,
                 reason="[RADIO] Automatic current programme change"
             )
+        except (discord.Forbidden, discord.NotFound):
+            # Retrying won't help
+            pass
 
-    async def check_current_programme(self) -> None:
-        self.nearest_programme, self.nearest_play_time = self.find_next_programme_and_play_time()
+    async def on_schedule_update(self, station: Station, state: ScheduleState) -> None:
+        # The objects get replaced, when an unchanged programme is reloaded
+        station.programme, station.programme_play_time = state.programme, state.play_time
+        station.nearest_programme, station.nearest_play_time = state.next_programme, state.next_play_time
 
-        if self.programme:
-            if self.programme.should_be_active():
-                return
-            else:
-                self.bot.log.info(f"Programme {self.programme.title} has ended")
-                self.programme, self.programme_play_time = None, None
-                self.tracks_programme = []
-
-                players = self.bot.lavalink.player_manager.find_all()
-                for player in players:
-                    await self.change_stage_channel_topic(int(player.guild_id))
-
-        for prog in self.all_programmes:
-            play_time = prog.should_be_active()
-            if play_time:
-                self.programme, self.programme_play_time = prog, play_time
-                self.bot.log.info(f"Programme {self.programme.title} has started")
-
-                players = self.bot.lavalink.player_manager.find_all()
-                for player in players:
-                    # Remove our old queued track if there is one and there are no other requests.
-                    # This allows the auto DJ to play programme tracks a bit faster.
-                    if len(player.queue) == 1 and player.queue[0].requester == self.bot.user.id:
-                        player.queue.clear()
-
-                    await self.change_stage_channel_topic(int(player.guild_id))
-
-    async def stats_give_users_listen_minutes(self, ids_and_minutes: list) -> None:
-        query = """
-                INSERT INTO radio_stats(user_id, guild_id, listening_minutes)
-                VALUES ($1, $2, $3) ON CONFLICT (user_id, guild_id)
-                DO UPDATE
-                SET listening_minutes = radio_stats.listening_minutes + $3;
-                """
+        if self.bot.cluster and self.bot.is_leader:
+            self.bot.cluster.broadcast('schedule', station=station.name, state=self.schedule_state_to_message(state))
 
-        async with self.bot.db.acquire() as connection:
-            async with connection.transaction():
-                # List of tuples with user ids, guild ids and minutes
-                await self.bot.db.executemany(query, ids_and_minutes)
+        if state.next_programme and state.next_starts_in <= PROGRAMME_PREWARM_MINUTES * 60:
+            self.prewarm_next_programme(station)
 
+    async def on_programme_end(self, station: Station, programme: RadioProgramme) -> None:
+        self.bot.log.info(f"Programme {programme.title} of station {station.name} has ended")
+        # The listening time so far belongs to the ended programme
+        self.bot.airtime.checkpoint()
 
-    async def stats_give_user_song_request(self, user_id: int, guild_id: int, requests: int) -> None:
-        query = """
-                INSERT INTO radio_stats(user_id, guild_id, song_requests)
-                VALUES ($1, $2, $3) ON CONFLICT (user_id, guild_id)
-                DO UPDATE
-                SET song_requests = radio_stats.song_requests + $3;
-                """
+        state = station.scheduler.state
+        # Keep the tracks, if the following programme uses the same playlist
+        following = (state.programme, state.next_programme)
+        if not any(prog and prog.playlists_file_name == programme.playlists_file_name for prog in following):
+            station.programme_tracks.pop(station.playlist_key(programme.playlists_file_name), None)
 
-        async with self.bot.db.acquire() as connection:
-            async with connection.transaction():
-                await self.bot.db.execute(query, user_id, guild_id, requests)
+        station.programme, station.programme_play_time = None, None
+        station.tracks_programme = []
+
+        # Another programme starts right away, that will update the players
+        if state.programme:
+            return
+
+        players = self.get_station_players(station)
+        for player in players:
+            self.replan_auto_queue(player)
+            self.update_on_air(int(player.guild_id))
+
+        self.change_stage_channel_topics(station, players)
+
+    async def on_programme_start(self, station: Station, programme: RadioProgramme, play_time: ProgrammePlayTime) -> None:
+        self.bot.airtime.checkpoint()
+        station.programme, station.programme_play_time = programme, play_time
+        # Already loaded in advance, unless the bot was started mid programme
+        station.tracks_programme = self.get_programme_tracks(station, programme)
+        self.bot.log.info(f"Programme {programme.title} of station {station.name} has started")
+
+        players = self.get_station_players(station)
+        for player in players:
+            # This allows the auto DJ to play programme tracks a bit faster.
+            self.replan_auto_queue(player)
+            self.update_on_air(int(player.guild_id))
+
+        self.change_stage_channel_topics(station, players)
+
+    def stats_add(self, user_id: int, guild_id: int, seconds: float = 0, requests: int = 0) -> None:
+        self.bot.stats.add(user_id, guild_id, seconds, requests)
+        self.leaderboards.add(user_id, guild_id, seconds / 60, requests)
+
+        if len(self.bot.stats) >= STATS_FLUSH_MAX_PENDING and not self.stats_flushing and hasattr(self.bot, 'db'):
+            self.start_stats_flush()
+
+    def start_stats_flush(self) -> asyncio.Task:
+        # Set before the task runs, so no other flush starts meanwhile
+        self.stats_flushing = True
+        self.stats_flush_task = self.bot.loop.create_task(self.stats_flush())
+        return self.stats_flush_task
+
+    async def stats_flush(self) -> None:
+        try:
+            cluster = self.bot.cluster
+            # Taken only when there is another leader to write them
+            if cluster and cluster.leader_id is not None and not cluster.is_leader:
+                cluster.send_to_leader('stats', stats=self.bot.stats.take(), airtime=self.bot.airtime.take())
+                return
+
+            await self.bot.stats.flush(self.bot.db)
+            await self.bot.airtime.flush(self.bot.db)
+        except Exception:
+            # The stats are kept for the next try
+            self.bot.log.error(traceback.format_exc())
+        finally:
+            self.stats_flushing = False
 
     @staticmethod
-    def is_track_on_cooldown(player: lavalink.BasePlayer, track: dict) -> bool:
-        return track['info']['identifier'] in player.fetch(key='cd', default=[])
+    def create_auto_queue_cooldown() -> Cooldown:
+        return Cooldown(count=SONG_AUTO_QUEUE_PLAY_COOLDOWN, seconds=SONG_AUTO_QUEUE_PLAY_COOLDOWN_SECONDS)
+
+    def get_rotation(self, player: lavalink.BasePlayer) -> Rotation:
+        rotation = player.fetch(key='rotation')
+        if not rotation:
+            if SONG_AUTO_QUEUE_SHARED_COOLDOWN:
+                cooldown = self.get_player_station(player).shared_cooldown
+            else:
+                cooldown = self.create_auto_queue_cooldown()
+
+            rotation = Rotation(cooldown)
+            player.store(key='rotation', value=rotation)
+
+        return rotation
 
     @staticmethod
-    def update_track_cooldown(player: lavalink.BasePlayer, track: dict) -> None:
-        current_cooldowns = player.fetch(key='cd', default=[])
-        
-        if len(current_cooldowns) >= SONG_AUTO_QUEUE_PLAY_COOLDOWN:
-            current_cooldowns.pop(0)
-        
-        current_cooldowns.append(track['info']['identifier'])
+    def is_auto_queued(track: lavalink.AudioTrack) -> bool:
+        return track.extra.get('auto', False)
 
-        player.store(key='cd', value=current_cooldowns)    
+    def fill_auto_queue(self, player: lavalink.BasePlayer) -> None:
+        if BROADCAST_MODE:
+            # The players follow the station timeline instead
+            return
 
-    @tasks.loop(minutes=1)
-    async def radio_stats_minutes_loop(self) -> None:
-        players = self.bot.lavalink.player_manager.find_all()
+        station = self.get_player_station(player)
+        planned = sum(1 for track in player.queue if self.is_auto_queued(track))
 
-        db_data_rows = []
+        while planned < AUTO_QUEUE_LOOKAHEAD:
+            name, tracks = self.choose_auto_queue_tracks(station)
+            # Skips the tracks on cooldown
+            track = self.get_rotation(player).draw(name, tracks)
+            if not track:
+                # Happens when something is still loading
+                return
 
-        for player in players:
-            # Lavalink.py stupidly stores guild_id as a string
-            guild = await convertors.get_fetch_guild(self.bot, int(player.guild_id))
-            if not guild:
-                continue # RIP?
+            player.add(requester=self.bot.user.id, track=lavalink.AudioTrack(track, self.bot.user.id, auto=True))
+            planned += 1
+            self.bot.log.info(f"Added track to auto queue {track['info']['title']}")
+
+    def next_broadcast_track(self, station: Station) -> typing.Optional[dict]:
+        # Same as the jingles and the auto queue of a player, just once for the whole station
+        if station.broadcast_jingle <= 0:
+            station.broadcast_jingle = random.randint(JINGLES_MIN_INTERVAL, JINGLES_MAX_INTERVAL)
+            jingle = self.choose_jingle(station)
+            if jingle:
+                return jingle
+
+        name, tracks = self.choose_auto_queue_tracks(station)
+        track = station.broadcast_rotation.draw(name, tracks)
+        if track:
+            station.broadcast_jingle -= 1
+
+        return track
+
+    async def broadcast_loop(self, station: Station) -> None:
+        """ Puts the next track on air, when the current one ends, and moves the players along """
+        while True:
+            remaining = station.broadcast.remaining()
+            if remaining > 0 or not self.bot.is_leader:
+                # Cluster followers get the tracks from the leader
+                await asyncio.sleep(remaining if self.bot.is_leader else 1)
+                continue
+
+            try:
+                track = self.next_broadcast_track(station)
+                if not track:
+                    # Happens when something is still loading
+                    await asyncio.sleep(1)
+                    continue
+
+                station.broadcast.start(track)
+                self.bot.log.info(f"On air on station {station.name}: {track['info']['title']}")
+                if self.bot.cluster:
+                    self.bot.cluster.broadcast('on_air', station=station.name, track=track, position=0)
+
+                await self.sync_broadcast_players(station)
+            except Exception:
+                self.bot.log.error(traceback.format_exc())
+                await asyncio.sleep(1)
+
+    async def join_broadcast(self, player: lavalink.DefaultPlayer) -> None:
+        station = self.get_player_station(player)
+        track = station.broadcast.current
+        if not track:
+            return
+
+        position = station.broadcast.position()
+        # Jingles are short, so only for the tracks that didn't just start
+        if position > 1000 and station.broadcast.remaining() < BROADCAST_JOIN_MIN_SECONDS:
+            # Joins with the next track
+            return
+
+        await player.play(track=lavalink.AudioTrack(track, self.bot.user.id, broadcast=True), start_time=position)
+
+    async def sync_broadcast_players(self, station: Station) -> None:
+        """ Moves the players on the station timeline to its current track, shards in parallel """
+        async def sync_shard(shard_players):
+            for player in shard_players:
+                # User requests are played first, the player joins after them
+                if player.queue or (player.current and not player.current.extra.get('broadcast')):
+                    continue
+
+                try:
+                    await self.join_broadcast(player)
+                except Exception:
+                    self.bot.log.error(traceback.format_exc())
+
+        players = [p for p in self.get_station_players(station) if p.is_connected and not p.paused]
+        await asyncio.gather(*(sync_shard(shard_players) for shard_players in self.group_by_shard(players).values()))
 
-            if guild.me.voice and guild.me.voice.channel:
-                channel = guild.me.voice.channel
+    def replan_auto_queue(self, player: lavalink.BasePlayer) -> None:
+        """ Replaces the planned auto queue tracks, keeping the user requests """
+        self.drop_auto_queue(player)
+        self.fill_auto_queue(player)
+
+    def drop_auto_queue(self, player: lavalink.BasePlayer) -> None:
+        cooldown = self.get_rotation(player).cooldown
+        kept = []
+        for track in player.queue:
+            if self.is_auto_queued(track):
+                # It was put on cooldown when planned, but it won't be played now
+                cooldown.remove(track.identifier)
             else:
-                self.bot.log.error(f"Can't get my voice state for guild {player.guild_id}")
-                continue
-            
+                kept.append(track)
+
+        player.queue[:] = kept
+
+    def is_listening(self, member: discord.Member, voice: discord.VoiceState) -> bool:
+        if member.bot or member.id in self.bot.blacklist:
+            return False
+
+        if not voice or not voice.channel or voice.self_deaf or voice.deaf:
+            return False
+
+        # Only the members in the same channel as the bot are listening
+        me = member.guild.me
+        return bool(me.voice and me.voice.channel and me.voice.channel.id == voice.channel.id)
+
+    def sync_guild_listeners(self, guild: discord.Guild) -> None:
+        for user_id, seconds in self.listening.stop_guild(guild.id):
+            self.stats_add(user_id, guild.id, seconds=seconds)
+
+        if guild.me.voice and guild.me.voice.channel:
+            channel = guild.me.voice.channel
             for member in channel.members:
-                if member.id in self.bot.blacklist:
-                    continue
+                if self.is_listening(member, member.voice):
+                    self.listening.start(guild.id, member.id, channel.id)
+
+        self.update_on_air(guild.id)
+
+    def update_on_air(self, guild_id: int) -> None:
+        """ Attributes the listening time so far to what was on air and starts counting anew """
+        player = None
+        if hasattr(self.bot, 'lavalink'):
+            player = self.bot.lavalink.player_manager.get(guild_id)
+
+        if player and player.is_connected:
+            listeners, track = self.listening.listeners(int(player.channel_id)), player.current
+            station = self.get_player_station(player)
+        else:
+            listeners, track = 0, None
+            station = self.get_station(guild_id)
+
+        programme = station.programme.title if station.programme else NO_PROGRAMME_TITLE
+        self.bot.airtime.update(guild_id, programme, track, listeners)
+
+    def stats_take_listening_time(self) -> None:
+        for user_id, guild_id, seconds in self.listening.checkpoint():
+            self.stats_add(user_id, guild_id, seconds=seconds)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        if member.id == self.bot.user.id:
+            # The topics could be edited by hand while we are away
+            for channel in (before.channel, after.channel):
+                if channel:
+                    self.topics.forget(channel.id)
+
+            # We joined, moved or left, so everyone's listening changes
+            self.sync_guild_listeners(member.guild)
+            return
+
+        key = (member.guild.id, member.id)
+        is_listening = self.is_listening(member, after)
+
+        if key in self.listening and not is_listening:
+            self.stats_add(member.id, member.guild.id, seconds=self.listening.stop(*key))
+            self.update_on_air(member.guild.id)
+        elif is_listening and key not in self.listening:
+            self.listening.start(member.guild.id, member.id, after.channel.id)
+            self.update_on_air(member.guild.id)
 
-                if not member.bot:
-                    voice_state = member.voice
-                    if not voice_state:
-                        self.bot.log.error(f"Can't get voice state for member {member.id}")
-                        continue
-                    
-                    if not voice_state.self_deaf and not voice_state.deaf:
-                        db_data_rows.append((member.id, guild.id, 1))
+    @commands.Cog.listener()
+    async def on_ready(self):
+        for guild in self.bot.guilds:
+            self.sync_guild_listeners(guild)
 
-        if db_data_rows:
-            await self.stats_give_users_listen_minutes(db_data_rows)
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id):
+        # Voice state updates could have been missed while the shard was down
+        for guild in self.bot.guilds:
+            if guild.shard_id == shard_id:
+                self.sync_guild_listeners(guild)
+
+    @staticmethod
+    def choose_auto_queue_tracks(station: Station) -> tuple:
+        if station.programme and station.tracks_programme:
+            return 'programme', station.tracks_programme
+
+        high = ('high', station.tracks_high)
+        medium = ('medium', station.tracks_medium)
+        low = ('low', station.tracks_low)
+
+        if random.randint(1, 10) > 4: # 60% chance to stay
+            tiers = (high, medium, low)
+        elif random.randint(1, 10) > 3: # 70% chance to stay
+            tiers = (medium, high, low)
+        else:
+            tiers = (low, medium, high)
+
+        # Fall back to the other lists, while the chosen one is still loading
+        return next((tier for tier in tiers if tier[1]), low)
 
     @tasks.loop(seconds=1)
     async def radio_loop(self) -> None:
         players = self.bot.lavalink.player_manager.find_all()
 
-        await self.check_current_programme()
+        # The catalogs are loaded only for the stations someone listens to.
+        # The cluster leader can't tell, it resolves them for the others too.
+        if self.bot.cluster and self.bot.is_leader:
+            stations = set(self.stations.values())
+        else:
+            stations = {self.default_station}
+            stations.update(self.get_player_station(player) for player in players)
+
+        for station in stations:
+            # Cluster followers only read what the leader has resolved so far, so they don't retry that often
+            can_load = self.bot.is_leader or time.monotonic() >= station.catalog_retry_at
+            if not self.bot.lavalink.node_manager.available_nodes or not can_load:
+                continue
+
+            if not self.bot.is_leader:
+                station.catalog_retry_at = time.monotonic() + CLUSTER_CATALOG_RETRY_SECONDS
+
+            programme = station.programme
+            if programme and station.playlist_key(programme.playlists_file_name) not in station.programme_tracks:
+                station.tracks_programme = self.get_programme_tracks(station, programme)
+
+            if not station.loading_tracks and not station.tracks_high:
+                self.bot.loop.create_task(self.load_all_playlists_from_files(station))
+
+        # Every player has its own supervisor, so a broken guild can't hold up the others
+        for guild_id in [guild_id for guild_id, task in self.player_tasks.items() if task.done()]:
+            del self.player_tasks[guild_id]
 
         for player in players:
-            if not self.loading_tracks:
-                if self.programme and not self.tracks_programme:
-                    self.bot.loop.create_task(self.load_programme_playlist_from_file(player))
-                elif not self.tracks_high:
-                    self.bot.loop.create_task(self.load_all_playlists_from_files(player))
-            
-            if player.is_connected and len(player.queue) == 0:
-                try:
-                    if self.programme:
-                        track = random.choice(self.tracks_programme)
-                    else:
-                        if random.randint(1, 10) > 4: # 60% chance to stay
-                            track = random.choice(self.tracks_high)
-                        elif random.randint(1, 10) > 3: # 70% chance to stay
-                            track = random.choice(self.tracks_medium)
-                        else:
-                            track = random.choice(self.tracks_low)
-                except IndexError:
-                    # Happens when something is still loading
-                    continue
+            guild_id = int(player.guild_id)
+            if guild_id not in self.player_tasks:
+                self.player_tasks[guild_id] = self.bot.loop.create_task(self.supervise_player_loop(guild_id))
 
-                if track['info']['isStream'] or track['info']['length'] > SONG_PLAYER_MAX_LENGHT_MILIS:
-                    # Track too long, redraw another.
-                    continue
+    def shard_id_of(self, guild_id: int) -> int:
+        return (guild_id >> 22) % (self.bot.shard_count or 1)
 
-                if self.is_track_on_cooldown(player, track):
-                    continue
+    def group_by_shard(self, players: list) -> dict:
+        shards = {}
+        for player in players:
+            shards.setdefault(self.shard_id_of(int(player.guild_id)), []).append(player)
+
+        return shards
+
+    @staticmethod
+    async def with_timeout(coro):
+        """ Bounds a single operation, so a stuck guild can't hold up its supervisor for long """
+        return await asyncio.wait_for(coro, PLAYER_OPERATION_TIMEOUT)
+
+    async def supervise_player_loop(self, guild_id: int) -> None:
+        """ Checks the player of the guild, until it is destroyed """
+        health = self.player_health[guild_id] = PlayerHealth(
+            base_delay=PLAYER_REPAIR_BASE_DELAY,
+            max_delay=PLAYER_REPAIR_MAX_DELAY,
+            park_after=PLAYER_PARK_AFTER_FAILURES,
+            park_seconds=PLAYER_PARK_SECONDS
+        )
+        try:
+            while True:
+                player = self.bot.lavalink.player_manager.get(guild_id)
+                if not player:
+                    return
+
+                shard = self.bot.get_shard(self.shard_id_of(guild_id))
+                # Reconnecting, the voice states can't be changed meanwhile
+                if shard and not shard.is_closed():
+                    try:
+                        await self.supervise_player(player, health)
+                    except Exception:
+                        self.bot.log.error(traceback.format_exc())
+
+                await asyncio.sleep(PLAYER_SUPERVISE_INTERVAL)
+        finally:
+            if self.player_health.get(guild_id) is health:
+                del self.player_health[guild_id]
+
+    def is_on_unavailable_node(self, player: lavalink.DefaultPlayer) -> bool:
+        # Nothing to move it to otherwise
+        return not player.node.available and bool(self.bot.lavalink.node_manager.available_nodes)
+
+    async def supervise_player(self, player: lavalink.DefaultPlayer, health: PlayerHealth) -> None:
+        on_unavailable_node = self.is_on_unavailable_node(player)
+
+        if player.is_connected and not on_unavailable_node:
+            self.fill_auto_queue(player)
+            if not player.queue and not player.current:
+                if BROADCAST_MODE:
+                    await self.with_timeout(self.join_broadcast(player))
+                # Happens when something is still loading
+                return self.mark_player_healthy(player, health)
+
+        if on_unavailable_node:
+            broken = True
+        elif player.is_connected:
+            broken = not player.paused and not player.is_playing
+        else:
+            broken = bool(player.fetch(key=f'chan:{player.guild_id}', default=0))
+
+        if not broken:
+            return self.mark_player_healthy(player, health)
+
+        if not health.can_repair():
+            return
+
+        try:
+            await self.repair_player(player)
+        except Exception:
+            self.bot.log.error(traceback.format_exc())
+
+        # Until a later check finds it working again
+        previous, state = health.state, health.failed()
+        if state == PlayerHealth.PARKED and previous != PlayerHealth.PARKED:
+            self.bot.log.critical(
+                f"Parked player {player.guild_id} after {health.failures} failed repairs, "
+                f"trying again in {health.retry_in():.0f} seconds"
+            )
+
+    def mark_player_healthy(self, player: lavalink.DefaultPlayer, health: PlayerHealth) -> None:
+        if health.succeeded():
+            self.bot.log.info(f"Player {player.guild_id} has recovered")
+
+    async def repair_player(self, player: lavalink.DefaultPlayer) -> None:
+        if self.is_on_unavailable_node(player):
+            self.bot.log.error("Found that player is on an unavailable node. Trying to move it")
+            await self.with_timeout(self.move_player(player))
+            # The rest is checked once it is moved
+            return
 
-                self.update_track_cooldown(player, track)
-                
-                player.add(requester=self.bot.user.id, track=track)
-                self.bot.log.info(f"Added track to auto queue {track['info']['title']}")
+        if not player.is_connected:
+            chan_id = player.fetch(key=f'chan:{player.guild_id}', default=0)
 
-            if not player.is_connected:
-                chan_id = player.fetch(key=f'chan:{player.guild_id}', default=0)
-                
-                if chan_id:
-                    guild = await convertors.get_fetch_guild(self.bot, int(player.guild_id))
-                    if not guild:
-                        continue
+            guild = await self.with_timeout(convertors.get_fetch_guild(self.bot, int(player.guild_id)))
+            if not guild:
+                return
 
-                    chan = guild.get_channel(chan_id)
-                    if not chan:
-                        chan = await self.bot.fetch_channel(chan_id)
+            chan = guild.get_channel(chan_id)
+            if not chan:
+                chan = await self.with_timeout(self.bot.fetch_channel(chan_id))
 
-                    self.bot.log.error("Found that player is not connected. Trying to reconnect")
-                    await guild.change_voice_state(channel=chan)
+            self.bot.log.error("Found that player is not connected. Trying to reconnect")
+            await self.with_timeout(guild.change_voice_state(channel=chan))
 
-                    if isinstance(chan, discord.StageChannel):
-                        if chan.permissions_for(guild.me).manage_channels:
-                            await guild.me.edit(suppress=False)
+            if isinstance(chan, discord.StageChannel):
+                if chan.permissions_for(guild.me).manage_channels:
+                    await self.with_timeout(guild.me.edit(suppress=False))
 
-            if not player.paused:
-                if player.is_connected and not player.is_playing:
-                    self.bot.log.error("Found that player is not playing. Trying to restart playback")
-                    await player.play()
+            # Playback is checked once it is connected
+            return
 
-                if player.is_connected and not player.current:
-                    self.bot.log.error("Found that player has no current track. Trying to skip")
-                    await player.skip()
+        if not player.is_playing:
+            self.bot.log.error("Found that player is not playing. Trying to restart playback")
+            await self.with_timeout(player.play())
+
+        if not player.current:
+            self.bot.log.error("Found that player has no current track. Trying to skip")
+            await self.with_timeout(player.skip())
+
+    @tasks.loop(seconds=STATS_FLUSH_INTERVAL)
+    async def stats_flush_loop(self) -> None:
+        if hasattr(self.bot, 'db') and not self.stats_flushing:
+            self.stats_take_listening_time()
+            self.bot.airtime.checkpoint()
+            await self.start_stats_flush()
+
+    @tasks.loop(seconds=STATS_HISTORY_INTERVAL)
+    async def stats_history_loop(self) -> None:
+        if not hasattr(self.bot, 'db') or not self.bot.is_leader:
+            return
+
+        try:
+            await history.ensure_partitions(self.bot.db)
+            await history.rollup(self.bot.db)
+            dropped = await history.prune(self.bot.db, STATS_HISTORY_HOURLY_MONTHS, STATS_HISTORY_WEEKLY_WEEKS)
+        except Exception:
+            return self.bot.log.error(traceback.format_exc())
+
+        if dropped:
+            self.bot.log.info(f"Dropped old stats history partitions: {', '.join(dropped)}")
+
+    @tasks.loop(seconds=JINGLES_REFRESH_INTERVAL)
+    async def jingles_refresh_loop(self) -> None:
+        if not self.bot.lavalink.node_manager.available_nodes:
+            return
+
+        directories = set()
+        for station in self.stations.values():
+            directories.add(station.jingles_directory)
+            directories.update(prog.jingles_diretory for prog in station.all_programmes if prog.jingles_diretory)
+
+        await self.jingles.refresh(directories, self.get_tracks)
 
     async def await_lavalink_attached(self) -> None:
         # Don't do anything before lavalink init
@@ -656,15 +1446,30 @@ class Music(commands.Cog):
     async def before_radio_loop(self):
         await self.await_lavalink_attached()
 
-    @radio_stats_minutes_loop.before_loop
-    async def before_radio_loop(self):
-         await self.await_lavalink_attached()
+    @jingles_refresh_loop.before_loop
+    async def before_jingles_refresh_loop(self):
+        await self.await_lavalink_attached()
 
     def cog_unload(self):
         """ Cog unload handler. This removes any event hooks that were registered. """
         self.bot.lavalink._event_hooks.clear()
         self.radio_loop.stop()
-        self.radio_stats_minutes_loop.cancel()
+        for task in self.player_tasks.values():
+            task.cancel()
+        # Keep the listening time counted so far
+        self.stats_take_listening_time()
+        self.bot.airtime.checkpoint()
+        self.jingles_refresh_loop.cancel()
+        self.stats_flush_loop.cancel()
+        self.stats_history_loop.cancel()
+        self.topics.stop()
+        for station in self.stations.values():
+            station.scheduler.stop()
+            if station.broadcast_task:
+                station.broadcast_task.cancel()
+        if self.bot.cluster:
+            for op in ('leader', 'schedule', 'schedule_sync', 'stats', 'catalog', 'on_air', 'reload'):
+                self.bot.cluster.remove_handler(op)
 
     async def cog_before_invoke(self, ctx):
         """ Command before-invoke handler. """
@@ -754,23 +1559,42 @@ class Music(commands.Cog):
         if isinstance(event, lavalink.events.TrackEndEvent):
             # Remove skip votes
             event.player.delete(key='skips')
+            if BROADCAST_MODE:
+                # The station timeline has the jingles
+                return
             # Handle jingles
             jingle_counter = event.player.fetch(key='jingle', default=-1)
             if jingle_counter <= 0:
-                await self.load_jingle(event.player)
-                self.bot.log.info("Loaded jingle to queue")
+                if self.queue_jingle(event.player):
+                    self.bot.log.info("Loaded jingle to queue")
                 event.player.store(key='jingle', value=random.randint(JINGLES_MIN_INTERVAL, JINGLES_MAX_INTERVAL))
             else:
                 event.player.store(key='jingle', value=jingle_counter - 1)
+        elif isinstance(event, lavalink.events.TrackStartEvent):
+            self.update_on_air(int(event.player.guild_id))
+            # Keep the look-ahead full, so the next track is ready in time
+            self.fill_auto_queue(event.player)
         elif isinstance(event, lavalink.events.QueueEndEvent):
-            self.radio_loop.restart()
+            self.update_on_air(int(event.player.guild_id))
+            # Only happens when nothing could be planned ahead, for example while loading
+            self.fill_auto_queue(event.player)
+            if event.player.queue:
+                await event.player.play()
+            elif BROADCAST_MODE:
+                await self.join_broadcast(event.player)
         elif isinstance(event, lavalink.events.TrackStuckEvent):
             await event.player.skip()
         elif isinstance(event, lavalink.events.TrackExceptionEvent):
             self.bot.log.error(f"Exception occured for track: {event.track.title}")
             self.bot.log.error(event.exception)
         elif isinstance(event, lavalink.events.NodeDisconnectedEvent):
-            self.bot.log.critical("Node got disconneceted!")
+            self.bot.log.critical(f"Node {event.node.name} got disconneceted! ({event.code} {event.reason})")
+            if not self.bot.lavalink.node_manager.available_nodes:
+                return self.bot.log.critical("No nodes available, the players will be moved once one is up")
+
+            # Lavalink.py moves all of them to the same node, spread them instead
+            for player in event.node.players:
+                await self.move_player(player)
 
     async def do_play(self, ctx, query):
         # Get the player for this guild from cache.
@@ -780,7 +1604,8 @@ class Music(commands.Cog):
 
         user_song_count_in_queue = sum(1 for x in player.queue if x.requester == ctx.author.id)
         if not is_owner:
-            allowed_song_count = USER_QUEUE_REQUESTS_LIMIT_PROGRAMME if self.programme else USER_QUEUE_REQUESTS_LIMIT
+            programme = self.get_player_station(player).programme
+            allowed_song_count = USER_QUEUE_REQUESTS_LIMIT_PROGRAMME if programme else USER_QUEUE_REQUESTS_LIMIT
 
             if user_song_count_in_queue >= allowed_song_count:
                 return await ctx.send(
@@ -790,14 +1615,12 @@ class Music(commands.Cog):
                     "var pasūtīt savas dziesmas.")
 
         # Remove leading and trailing <>. <> may be used to suppress embedding links in Discord.
-        query = query.strip('<>')
-
         # Check if the user input might be a URL. If it isn't, we can Lavalink do a YouTube search for it instead.
         # SoundCloud searching is possible by prefixing "scsearch:" instead.
-        if not URL_REGX.match(query):
-            query = f'ytsearch:{query}'
+        query = normalize_search_query(query)
 
-        results = await player.node.get_tracks(query)
+        # Popular requests repeat a lot, so the results are cached
+        results = await self.search_cache.get_tracks(query, player.node.get_tracks)
 
         # Results could be None if Lavalink returns an invalid response (non-JSON/non-200 (OK)).
         # ALternatively, resullts['tracks'] could be an empty array if the query yielded no tracks.
@@ -826,7 +1649,9 @@ class Music(commands.Cog):
         embed.title = '\u2705 Dziesma pievienota queue!'
         embed.description = f'[{track["info"]["title"]}]({track["info"]["uri"]})'
 
-        player.add(requester=ctx.author.id, track=track)
+        # User requests are played before the planned auto queue tracks
+        index = next((i for i, x in enumerate(player.queue) if self.is_auto_queued(x)), None)
+        player.add(requester=ctx.author.id, track=track, index=index)
 
         await ctx.send(embed=embed)
 
@@ -835,7 +1660,7 @@ class Music(commands.Cog):
         if not player.is_playing:
             await player.play()
 
-        await self.stats_give_user_song_request(ctx.author.id, ctx.guild.id, 1)
+        self.stats_add(ctx.author.id, ctx.guild.id, requests=1)
 
     @cog_ext.cog_slash(name="play", description="\u25b6\ufe0f Pasūtīt dziesmu radio")
     async def slash_play(self, ctx: SlashContext, dziesma: str):
@@ -857,15 +1682,18 @@ class Music(commands.Cog):
             await player.skip()
             return await ctx.send('\u23e9')
 
+        if skip_track.extra.get('broadcast') and not player.queue:
+            # Skipping would just join the same track again
+            return await ctx.send("\ud83d\udcfb Šo dziesmu dzird visi radio klausītāji, to nevar skipot.")
+
         if await self.bot.is_owner(ctx.author):
             await player.skip()
         elif player.current.requester == ctx.author.id:
             await player.skip()
         else:
-            channel = self.bot.get_channel(int(player.channel_id))
             # The amount of people (not bots) that are actually listening right now
-            real_listners = [x for x in channel.members if not x.bot and not x.voice.self_deaf and not x.voice.deaf]
-            required_votes = math.ceil(len(real_listners) / 2.5)
+            real_listeners = self.listening.listeners(int(player.channel_id))
+            required_votes = math.ceil(real_listeners / 2.5)
 
             votes = player.fetch(key='skips', default=[])
             if ctx.author.id in votes:
@@ -928,15 +1756,15 @@ class Music(commands.Cog):
 
         queue_to_display = []
         for track in player.queue:
-            # Don't add local files
-            if URL_REGX.match(track.uri):
+            # Don't add local files, nor the planned auto queue tracks
+            if URL_REGX.match(track.uri) and not self.is_auto_queued(track):
                 queue_to_display.append(track)
 
         if not queue_to_display:
             return await ctx.send('\ud83d\udcc3 Nākošo dziesmu queue ir tukšs.')
 
         items_per_page = 10
-        pages = math.ceil(len(player.queue) / items_per_page)
+        pages = math.ceil(len(queue_to_display) / items_per_page)
 
         start = (page - 1) * items_per_page
         end = start + items_per_page
@@ -966,10 +1794,8 @@ class Music(commands.Cog):
     async def do_find_songs(self, ctx, query):
         player = self.bot.lavalink.player_manager.get(ctx.guild.id)
 
-        if not query.startswith('ytsearch:') and not query.startswith('scsearch:'):
-            query = 'ytsearch:' + query
-
-        results = await player.node.get_tracks(query)
+        query = normalize_search_query(query)
+        results = await self.search_cache.get_tracks(query, player.node.get_tracks)
 
         if not results or not results['tracks']:
             return await ctx.send('\u274c Neko neatradu.')
@@ -1036,16 +1862,17 @@ class Music(commands.Cog):
             '\n\n\ud83d\udd34 Pašlaik radio ēterā: '
         )
 
-        if not self.programme:
+        station = self.get_player_station(player)
+        if not station.programme:
             now_playing_info += f"**{NO_PROGRAMME_TITLE}**\n{NO_PROGRAMME_DESCRIPTION}"
         else:
-            programme = self.programme
-            current_play_time_str = self.format_programme_playtime_to_string(self.programme_play_time)
+            programme = station.programme
+            current_play_time_str = self.format_programme_playtime_to_string(station.programme_play_time)
             now_playing_info += f"**{programme.title}**\n{current_play_time_str}{programme.description}"
 
-        nearest = self.nearest_programme
+        nearest = station.nearest_programme
         if nearest:
-            next_play_time_str = self.format_programme_playtime_to_string(self.nearest_play_time)
+            next_play_time_str = self.format_programme_playtime_to_string(station.nearest_play_time)
             now_playing_info += (
                 f"\n\n\u23ed\ufe0f Turpinājumā: **{nearest.title}**"
                 f"\n{next_play_time_str}{nearest.description}"
@@ -1054,6 +1881,8 @@ class Music(commands.Cog):
         embed = discord.Embed(color=16717068,
                               title='\u25b6\ufe0f Tagad skan', description=now_playing_info)
         embed.set_footer(text="Radio programma: Apskati ar komandu /programma")
+        if len(self.stations) > 1:
+            embed.set_author(name=f"\ud83d\udcfb Stacija: {station.name}")
         
         await ctx.send(embed=embed)
 
@@ -1084,7 +1913,7 @@ class Music(commands.Cog):
 
         await ctx.send(f"\ud83e\uddf9 Ok, izņēmu tavu pēdējo pasūtīto dziesmu **{to_remove.title}** no queue.")
         
-        await self.stats_give_user_song_request(ctx.author.id, ctx.guild.id, -1)
+        self.stats_add(ctx.author.id, ctx.guild.id, requests=-1)
 
     @cog_ext.cog_slash(
         name="remove",
@@ -1116,22 +1945,98 @@ class Music(commands.Cog):
     @commands.command()
     async def reloadplaylists(self, ctx):
         """ Reloads all auto queue playlists """
-        player = self.bot.lavalink.player_manager.get(ctx.guild.id)
-        
-        self.tracks_low = []
-        self.tracks_medium = []
-        self.tracks_high = []
-        self.tracks_programme = []
+        if any(station.loading_tracks for station in self.stations.values()):
+            return await ctx.send('\u274c Playlists are still loading, check `loadstatus`.')
+
+        if self.bot.cluster and self.bot.cluster.send_to_leader('reload', what='playlists'):
+            # The leader resolves them and lets the others know about the changed ones
+            return await ctx.send('\u2705 Playlists are reloaded by the leader, check `loadstatus` there.')
 
         await ctx.message.add_reaction('\u231b')
-        
-        if self.programme:
-            await self.load_programme_playlist_from_file(player)
-        else:
-            await self.load_all_playlists_from_files(player)
+        await self.reload_all_playlists()
+        await ctx.message.add_reaction('\u2705')
+
+    @commands.is_owner()
+    @commands.command()
+    async def reloadschedule(self, ctx):
+        """ Reloads the radio programme schedules of all stations """
+        try:
+            schedules = self.load_schedules()
+        except ValueError as e:
+            # None of them are reloaded then
+            return await ctx.send(f'\u274c {e}')
+
+        if not self.bot.cluster or not self.bot.cluster.send_to_leader('reload', what='schedule'):
+            self.apply_schedules(schedules)
+            if self.bot.cluster:
+                self.bot.cluster.broadcast('reload', what='schedule')
 
         await ctx.message.add_reaction('\u2705')
 
+    @commands.is_owner()
+    @commands.command()
+    async def searchcache(self, ctx):
+        """ Shows the search cache stats """
+        cache = self.search_cache
+        lookups = cache.hits + cache.misses
+        hit_rate = cache.hits / lookups * 100 if lookups else 0
+
+        await ctx.send(
+            f"Entries: {len(cache)}/{cache.max_size}, hits: {cache.hits}, "
+            f"misses: {cache.misses} ({hit_rate:.1f}% hit rate)"
+        )
+
+    @commands.is_owner()
+    @commands.command()
+    async def loadstatus(self, ctx):
+        """ Shows the loading progress of the playlists """
+        if not self.resolver.progress:
+            return await ctx.send('\u274c No playlists have been loaded yet.')
+
+        table = formats.TabularData()
+        table.set_columns(['Playlist', 'Resolved', 'Failed', 'Pending'])
+        table.add_rows(
+            (name, progress.resolved, progress.failed, progress.pending)
+            for name, progress in self.resolver.progress.items()
+        )
+
+        await ctx.send(f'```\n{table.render()}\n```')
+
+    @commands.is_owner()
+    @commands.command()
+    async def playerhealth(self, ctx):
+        """ Shows the players that are being repaired or are parked """
+        unhealthy = sorted(
+            (guild_id, health) for guild_id, health in self.player_health.items()
+            if health.state != PlayerHealth.HEALTHY
+        )
+        if not unhealthy:
+            return await ctx.send(f'\u2705 All {len(self.player_health)} players are healthy.')
+
+        lines = '\n'.join(
+            f'{guild_id}: {health.state}, {health.failures} failed repairs, next in {health.retry_in():.0f}s'
+            for guild_id, health in unhealthy[:20]
+        )
+        await ctx.send(f'```\n{lines}\n```')
+
+    @commands.is_owner()
+    @commands.command()
+    async def catalogreport(self, ctx):
+        """ Shows the playlist tracks that are left out of auto queue """
+        if not any(self.ineligible_tracks.values()):
+            return await ctx.send('\u2705 All loaded tracks are playable.')
+
+        table = formats.TabularData()
+        table.set_columns(['Playlist', 'Track', 'Reason'])
+        for name, tracks in self.ineligible_tracks.items():
+            table.add_rows((name, title[:40], reason) for title, reason in tracks)
+
+        report = table.render()
+        if len(report) > 1900:
+            report = report[:1900].rsplit('\n', 1)[0] + '\n...'
+
+        await ctx.send(f'```\n{report}\n```')
+
     @commands.is_owner()
     @commands.command()
     async def clear(self, ctx, index: int = 0):
@@ -1154,29 +2059,83 @@ class Music(commands.Cog):
 
         return days, hours, minutes
 
-    async def do_view_user_stats(self, ctx, user):
-        target_member = user or ctx.author
+    async def get_user_stats(self, guild_id: int, user_id: int) -> tuple:
+        stats = self.leaderboards.get_user(guild_id, user_id)
+        if stats:
+            return stats
 
         query = """
-                SELECT * FROM radio_stats
+                SELECT listening_minutes, song_requests FROM radio_stats
                 WHERE user_id = $1
                 AND guild_id = $2;
                 """
-        
-        user_data = await self.bot.db.fetchrow(query, target_member.id, ctx.guild.id)
-        if not user_data:
+
+        user_data = await self.bot.db.fetchrow(query, user_id, guild_id)
+        # Add the stats that are not written to the database yet
+        pending_minutes, pending_requests = self.bot.stats.get(user_id, guild_id)
+        listening_minutes = (user_data["listening_minutes"] if user_data else 0) + pending_minutes
+        song_requests = (user_data["song_requests"] if user_data else 0) + pending_requests
+
+        self.leaderboards.set_user(guild_id, user_id, listening_minutes, song_requests)
+        return listening_minutes, song_requests
+
+    async def get_leaderboard(self, guild: discord.Guild) -> Leaderboard:
+        board = self.leaderboards.get_board(guild.id)
+        if board:
+            return board
+
+        # Both are served by the (guild_id, ...) indexes
+        query_minutes = """
+                SELECT user_id, listening_minutes FROM radio_stats
+                WHERE guild_id = $1
+                ORDER BY listening_minutes DESC
+                LIMIT $2;
+                """
+
+        query_requests = """
+                SELECT user_id, song_requests FROM radio_stats
+                WHERE guild_id = $1
+                ORDER BY song_requests DESC
+                LIMIT $2;
+                """
+
+        top_minutes, top_requests = await asyncio.gather(
+            self.bot.db.fetch(query_minutes, guild.id, LEADERBOARD_SIZE),
+            self.bot.db.fetch(query_requests, guild.id, LEADERBOARD_SIZE)
+        )
+
+        minutes, requests = {}, {}
+        for row in top_minutes:
+            minutes[row['user_id']] = row['listening_minutes'] + self.bot.stats.get(row['user_id'], guild.id)[0]
+        for row in top_requests:
+            requests[row['user_id']] = row['song_requests'] + self.bot.stats.get(row['user_id'], guild.id)[1]
+
+        board = self.leaderboards.set_board(guild.id, minutes, requests)
+
+        members = await convertors.get_fetch_members(guild, board.user_ids())
+        for user_id, member in members.items():
+            self.leaderboards.names[user_id] = str(member)
+
+        return board
+
+    async def do_view_user_stats(self, ctx, user):
+        target_member = user or ctx.author
+
+        listening_minutes, song_requests = await self.get_user_stats(ctx.guild.id, target_member.id)
+        listening_minutes = int(listening_minutes)
+        if not listening_minutes and not song_requests:
             return await ctx.send(f"\u274c **{target_member}** nav klausījies/-usies radio. :(")
 
         embed = discord.Embed(
             color=discord.Color.random(),
             title=f"\ud83d\udcca {target_member} radio statistika"
         )
-        days, hours, minutes = self.minutes_to_days(user_data["listening_minutes"])
+        days, hours, minutes = self.minutes_to_days(listening_minutes)
         embed.add_field(
             name="\ud83d\udd50 Klausīšanās ilgums",
             value=f"{days} dienas {hours} stundas {minutes} minūtes"
         )
-        embed.add_field(name="\ud83c\udfb6 Pasūtītās dziesmas", value=f"{user_data['song_requests']}")
+        embed.add_field(name="\ud83c\udfb6 Pasūtītās dziesmas", value=f"{song_requests}")
 
         await ctx.send(embed=embed)
 
@@ -1196,22 +2155,9 @@ class Music(commands.Cog):
         await self.do_view_user_stats(ctx, cits_lietotajs)
 
     async def do_view_top_users(self, ctx):
-        query_minutes = """
-                SELECT * FROM radio_stats
-                WHERE guild_id = $1
-                ORDER BY listening_minutes DESC
-                LIMIT 8;
-                """
-
-        query_requests = """
-                SELECT * FROM radio_stats
-                WHERE guild_id = $1
-                ORDER BY song_requests DESC
-                LIMIT 8;
-                """
-
-        top_minutes = await self.bot.db.fetch(query_minutes, ctx.guild.id)
-        top_requests = await self.bot.db.fetch(query_requests, ctx.guild.id)
+        board = await self.get_leaderboard(ctx.guild)
+        top_minutes = board.top_minutes(LEADERBOARD_SIZE)
+        top_requests = board.top_requests(LEADERBOARD_SIZE)
 
         embed = discord.Embed(
             color=16173112,
@@ -1220,25 +2166,17 @@ class Music(commands.Cog):
 
         embed.description = "\ud83d\udd50 **Klausīšanās ilgums:**"
         if top_minutes:
-            for top_data in top_minutes:
-                user = await convertors.get_fetch_member(ctx.guild, top_data['user_id'])
-                if user:
-                    username = user.name + '#' + user.discriminator
-                else:
-                    username = 'Nezināms klausītājs'
-                embed.description += f"\n`{username}` - {top_data['listening_minutes']} minūtes"
+            for user_id, listening_minutes in top_minutes:
+                username = self.leaderboards.names.get(user_id, 'Nezināms klausītājs')
+                embed.description += f"\n`{username}` - {int(listening_minutes)} minūtes"
         else:
             embed.description += "\nNav datu :\\"
         
         embed.description += "\n\n\ud83c\udfb6 **Pasūtītās dziesmas:**"
         if top_requests:
-            for top_data in top_requests:
-                user = await convertors.get_fetch_member(ctx.guild, top_data['user_id'])
-                if user:
-                    username = user.name + '#' + user.discriminator
-                else:
-                    username = 'Nezināms klausītājs'
-                embed.description += f"\n`{username}` - {top_data['song_requests']} dziesmas"
+            for user_id, song_requests in top_requests:
+                username = self.leaderboards.names.get(user_id, 'Nezināms klausītājs')
+                embed.description += f"\n`{username}` - {song_requests} dziesmas"
         else:
             embed.description += "\nNav datu :\\"
 
@@ -1260,7 +2198,9 @@ class Music(commands.Cog):
         await self.do_view_top_users(ctx)
 
     async def do_view_radio_programmes(self, ctx, page):
-        if not self.all_programmes:
+        player = self.bot.lavalink.player_manager.get(ctx.guild.id)
+        station = self.get_player_station(player) if player else self.get_station(ctx.guild.id)
+        if not station.all_programmes:
             return await ctx.send("\u274c Nav radio programmu")
 
         embed = discord.Embed(
@@ -1271,7 +2211,7 @@ class Music(commands.Cog):
         programmes_to_display = []
         embed.description = ''
 
-        for prog in self.all_programmes:
+        for prog in station.all_programmes:
             programme_str = f"**{prog.title}** - {prog.description}\n"
             for play_time in prog.play_times:
                 programme_str += self.format_programme_playtime_to_string(play_time)
@@ -1305,6 +2245,83 @@ class Music(commands.Cog):
         """ \ud83d\udcf0 Apskati radio programmu """
         await self.do_view_radio_programmes(ctx, lapa)
 
+    async def switch_station(self, player: lavalink.DefaultPlayer) -> None:
+        """ Moves the player over to the station it is subscribed to now """
+        self.drop_auto_queue(player)
+        # The rotation could be sharing the cooldown of the previous station
+        player.delete(key='rotation')
+        self.fill_auto_queue(player)
+        self.update_on_air(int(player.guild_id))
+
+        if BROADCAST_MODE and not player.queue and (not player.current or player.current.extra.get('broadcast')):
+            await self.join_broadcast(player)
+
+        self.change_stage_channel_topics(self.get_player_station(player), [player])
+
+    async def do_assign_station(self, ctx, object_id: int, name: typing.Optional[str]) -> None:
+        player = self.bot.lavalink.player_manager.get(ctx.guild.id)
+        stations = ', '.join(f'`{station}`' for station in self.stations)
+
+        if not name:
+            current = self.get_player_station(player)
+            return await ctx.send(f"\ud83d\udcfb Pašlaik skan stacija **{current.name}**. Pieejamās stacijas: {stations}")
+
+        # "-" subscribes back to the default, for the voice channel that is the station of the server
+        station = self.default_station if name == '-' else self.stations.get(name)
+        if not station:
+            return await ctx.send(f"\u274c Nav tādas stacijas. Pieejamās stacijas: {stations}")
+
+        if name == '-' or (object_id == ctx.guild.id and station is self.default_station):
+            try:
+                await self.station_assignments.remove(object_id)
+            except KeyError:
+                pass
+        else:
+            await self.station_assignments.put(object_id, station.name)
+
+        await self.switch_station(player)
+        await ctx.send(f"\ud83d\udcfb Tagad skan stacija **{self.get_player_station(player).name}**!")
+
+    @cog_ext.cog_slash(name="stacija", description="\ud83d\udcfb Izvēlēties radio staciju šim serverim")
+    async def slash_stacija(self, ctx: SlashContext, nosaukums: str = None):
+        if not await self.ensure_slash_voice(ctx):
+            return
+
+        if nosaukums and not ctx.author.guild_permissions.manage_guild:
+            return await ctx.send('\u274c Tev nepieciešami `MANAGE_GUILD` permissions.', hidden=True)
+
+        await self.do_assign_station(ctx, ctx.guild.id, nosaukums)
+
+    @commands.command()
+    async def stacija(self, ctx, nosaukums: str = None):
+        """ \ud83d\udcfb Izvēlēties radio staciju šim serverim """
+        # Anyone can see the current station
+        if nosaukums and not ctx.author.guild_permissions.manage_guild:
+            return await ctx.send('\u274c Tev nepieciešami `MANAGE_GUILD` permissions.')
+
+        await self.do_assign_station(ctx, ctx.guild.id, nosaukums)
+
+    @cog_ext.cog_slash(name="kanalastacija", description="\ud83d\udcfb Izvēlēties radio staciju šim voice kanālam")
+    async def slash_kanalastacija(self, ctx: SlashContext, nosaukums: str = None):
+        if not await self.ensure_slash_voice(ctx):
+            return
+
+        channel = ctx.author.voice.channel
+        if nosaukums and not channel.permissions_for(ctx.author).manage_channels:
+            return await ctx.send('\u274c Tev nepieciešami `MANAGE_CHANNELS` permissions.', hidden=True)
+
+        await self.do_assign_station(ctx, channel.id, nosaukums)
+
+    @commands.command()
+    async def kanalastacija(self, ctx, nosaukums: str = None):
+        """ \ud83d\udcfb Izvēlēties radio staciju šim voice kanālam ("-" - servera stacija) """
+        # The permission in the voice channel, not in the text channel of the command
+        channel = ctx.author.voice.channel
+        if nosaukums and not channel.permissions_for(ctx.author).manage_channels:
+            return await ctx.send('\u274c Tev nepieciešami `MANAGE_CHANNELS` permissions.')
+
+        await self.do_assign_station(ctx, channel.id, nosaukums)
+
 
 def setup(bot):
     bot.add_cog(Music(bot))
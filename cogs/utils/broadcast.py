@@ -0,0 +1,30 @@
+import time
+
+
+class StationTimeline:
+    """The on air track of the station, shared by all the players in broadcast mode.
+
+    Every track is picked once for the whole station and remembers when it
+    started, so any player can join it at the same position.
+    """
+
+    def __init__(self) -> None:
+        # Lavalink track dict
+        self.current = None
+        self._started = 0.0
+
+    def start(self, track: dict, position: int = 0) -> None:
+        """Puts the track on air, ``position`` milliseconds into it."""
+        self.current = track
+        self._started = time.monotonic() - position / 1000
+
+    def position(self) -> int:
+        """Milliseconds into the current track."""
+        return int((time.monotonic() - self._started) * 1000)
+
+    def remaining(self) -> float:
+        """Seconds until the current track ends."""
+        if not self.current:
+            return 0
+
+        return max(self.current['info']['length'] / 1000 - (time.monotonic() - self._started), 0)
@@ -0,0 +1,127 @@
+import asyncio
+import traceback
+
+
+class ClusterLink:
+    """Worker end of the pipe to the cluster launcher, see launcher.py
+
+    Messages are dicts with an ``op`` key. The launcher relays broadcasts to
+    all the other workers and the messages for the leader to the worker it
+    elected, and lets everyone know who the leader is with a ``leader`` message.
+    """
+
+    def __init__(self, cluster_id: int, connection, **options) -> None:
+        self.cluster_id = cluster_id
+        self.loop = options.pop('loop', asyncio.get_event_loop())
+        self.log = options.pop('log')
+        self.leader_id = None
+
+        self._connection = connection
+        # op -> coroutine function, called with the message
+        self._handlers = {}
+        self.loop.add_reader(connection.fileno(), self._receive)
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader_id == self.cluster_id
+
+    def set_handler(self, op: str, handler) -> None:
+        self._handlers[op] = handler
+
+    def remove_handler(self, op: str) -> None:
+        self._handlers.pop(op, None)
+
+    def send(self, op: str, **data) -> None:
+        try:
+            self._connection.send({'op': op, **data})
+        except (OSError, ValueError):
+            self.log.error(f"Could not send {op} to the launcher")
+
+    def broadcast(self, op: str, **data) -> None:
+        self.send('broadcast', message={'op': op, **data})
+
+    def send_to_leader(self, op: str, **data) -> bool:
+        """Returns False if there is no other leader to send to."""
+        if self.leader_id is None or self.is_leader:
+            return False
+
+        self.send('to_leader', message={'op': op, **data})
+        return True
+
+    def _receive(self) -> None:
+        try:
+            message = self._connection.recv()
+        except (EOFError, OSError):
+            # The launcher is gone, we are on our own now
+            self.loop.remove_reader(self._connection.fileno())
+            self.leader_id = self.cluster_id
+            message = {'op': 'leader', 'cluster_id': self.cluster_id}
+            self.log.critical("Lost the connection to the launcher")
+
+        if message['op'] == 'leader':
+            self.leader_id = message['cluster_id']
+
+        handler = self._handlers.get(message['op'])
+        if handler:
+            self.loop.create_task(self._handle(handler, message))
+
+    async def _handle(self, handler, message: dict) -> None:
+        try:
+            await handler(message)
+        except Exception:
+            self.log.error(traceback.format_exc())
+
+
+class ClusterConfig:
+    """A :class:`Config` shared by all the workers of a cluster.
+
+    Only the leader writes the file. The others send it their changes and
+    every worker applies the changes the leader broadcasts, so they all see
+    the same entries without writing over each other.
+    """
+
+    def __init__(self, config, cluster: ClusterLink) -> None:
+        self.config = config
+        self.cluster = cluster
+        self.op = f'config:{config.name}'
+        cluster.set_handler(self.op, self._on_change)
+
+    async def _write(self, entry: list) -> None:
+        await self.config._change(entry)
+        self.cluster.broadcast(self.op, entry=entry)
+
+    async def _change(self, entry: list) -> None:
+        if self.cluster.send_to_leader(self.op, entry=entry):
+            # Seen here right away, the leader writes it
+            self.config._apply(*entry)
+        else:
+            await self._write(entry)
+
+    async def _on_change(self, message: dict) -> None:
+        if self.cluster.is_leader:
+            await self._write(message['entry'])
+        else:
+            self.config._apply(*message['entry'])
+
+    def get(self, key, *args):
+        return self.config.get(key, *args)
+
+    async def put(self, key, value) -> None:
+        await self._change(['put', str(key), value])
+
+    async def remove(self, key) -> None:
+        if key not in self.config:
+            raise KeyError(key)
+        await self._change(['remove', str(key)])
+
+    def __contains__(self, item) -> bool:
+        return item in self.config
+
+    def __getitem__(self, item):
+        return self.config[item]
+
+    def __len__(self) -> int:
+        return len(self.config)
+
+    def all(self) -> dict:
+        return self.config.all()
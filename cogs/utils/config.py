@@ -15,11 +15,31 @@ def _create_encoder(cls):
 
     return type('_Encoder', (json.JSONEncoder,), { 'default': _default })
 
+def _int_key(key):
+    try:
+        value = int(key)
+    except ValueError:
+        return None
+
+    return value if str(value) == key else None
+
 class Config:
-    """The "database" object. Internally based on ``json``."""
+    """The "database" object. Internally based on ``json``.
+
+    Changes are appended to a journal next to the file, in batches written a
+    moment after the first change. The journal gets folded into the file, once
+    it has more entries than there are keys. A torn journal entry of a crash
+    is ignored on load, so reads always see the last fully written state.
+    """
+
+    # Seconds to wait for more changes, before writing them
+    FLUSH_DELAY = 0.5
+    # Min. amount of journal entries, before the journal is compacted
+    COMPACT_MIN_ENTRIES = 1000
 
     def __init__(self, name, **options):
         self.name = name
+        self.journal_name = '%s.journal' % name
         self.object_hook = options.pop('object_hook', None)
         self.encoder = options.pop('encoder', None)
 
@@ -32,12 +52,32 @@ class Config:
             self.encoder = _create_encoder(hook)
 
         self.loop = options.pop('loop', asyncio.get_event_loop())
+        # Other processes write the file too, see ClusterConfig
+        self.shared = options.pop('shared', False)
         self.lock = asyncio.Lock()
+        # Journal entries that are not written yet and the future for when they are
+        self._pending = []
+        self._pending_written = None
+        self._journal_entries = 0
         if options.pop('load_later', False):
+            self._db, self._ints = {}, {}
             self.loop.create_task(self.load())
         else:
             self.load_from_file()
 
+    def _apply(self, op, key, value=None):
+        # Integer keys are indexed natively, so the lookups by ids don't need str()
+        int_key = _int_key(key)
+
+        if op == 'put':
+            self._db[key] = value
+            if int_key is not None:
+                self._ints[int_key] = value
+        else:
+            self._db.pop(key, None)
+            if int_key is not None:
+                self._ints.pop(int_key, None)
+
     def load_from_file(self):
         try:
             with open(self.name, 'r') as f:
@@ -45,6 +85,36 @@ class Config:
         except FileNotFoundError:
             self._db = {}
 
+        self._ints = {}
+        for key, value in self._db.items():
+            int_key = _int_key(key)
+            if int_key is not None:
+                self._ints[int_key] = value
+        self._journal_entries = 0
+
+        torn = False
+        try:
+            with open(self.journal_name, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        if not line.endswith('\n'):
+                            raise ValueError('Incomplete entry')
+                        entry = json.loads(line, object_hook=self.object_hook)
+                    except ValueError:
+                        # Everything before it is intact
+                        torn = True
+                        break
+
+                    self._apply(*entry)
+                    self._journal_entries += 1
+        except FileNotFoundError:
+            pass
+
+        if torn and not self.shared:
+            # The next entries would be appended to the torn one.
+            # A shared journal could be just being written by another process.
+            self._compact()
+
     async def load(self):
         async with self.lock:
             await self.loop.run_in_executor(None, self.load_from_file)
@@ -57,28 +127,99 @@ class Config:
         # atomically move the file
         os.replace(temp, self.name)
 
+    def _compact(self):
+        self._dump()
+        # Replaying the journal again would not change anything,
+        # so a crash before this is fine.
+        with open(self.journal_name, 'w', encoding='utf-8'):
+            pass
+        self._journal_entries = 0
+
+    def _write(self, entries):
+        with open(self.journal_name, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=True, cls=self.encoder, separators=(',', ':')))
+                f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._journal_entries += len(entries)
+        if self._journal_entries >= max(self.COMPACT_MIN_ENTRIES, len(self._db)):
+            self._compact()
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.FLUSH_DELAY)
+        try:
+            await self.flush()
+        except Exception:
+            # The waiting changes got the exception
+            pass
+
+    async def _change(self, entry):
+        self._apply(*entry)
+        self._pending.append(entry)
+
+        if self._pending_written is None:
+            self._pending_written = self.loop.create_future()
+            self.loop.create_task(self._flush_later())
+
+        # All the changes of the batch are written together
+        await asyncio.shield(self._pending_written)
+
+    async def flush(self):
+        """Writes the pending changes to the journal."""
+        async with self.lock:
+            entries, self._pending = self._pending, []
+            written, self._pending_written = self._pending_written, None
+            if not entries:
+                if written:
+                    written.set_result(None)
+                return
+
+            try:
+                await self.loop.run_in_executor(None, self._write, entries)
+            except Exception as e:
+                # Try again a bit later
+                self._pending[:0] = entries
+                if self._pending_written is None:
+                    self._pending_written = self.loop.create_future()
+                    self.loop.create_task(self._flush_later())
+                written.set_exception(e)
+                raise
+            else:
+                written.set_result(None)
+
     async def save(self):
+        """Writes the pending changes and compacts the journal into the file."""
+        await self.flush()
         async with self.lock:
-            await self.loop.run_in_executor(None, self._dump)
+            await self.loop.run_in_executor(None, self._compact)
 
     def get(self, key, *args):
         """Retrieves a config entry."""
+        if type(key) is int:
+            return self._ints.get(key, *args)
         return self._db.get(str(key), *args)
 
     async def put(self, key, value, *args):
         """Edits a config entry."""
-        self._db[str(key)] = value
-        await self.save()
+        await self._change(['put', str(key), value])
 
     async def remove(self, key):
         """Removes a config entry."""
-        del self._db[str(key)]
-        await self.save()
+        key = str(key)
+        if key not in self._db:
+            raise KeyError(key)
+        await self._change(['remove', key])
 
     def __contains__(self, item):
+        if type(item) is int:
+            return item in self._ints
         return str(item) in self._db
 
     def __getitem__(self, item):
+        if type(item) is int:
+            return self._ints[item]
         return self._db[str(item)]
 
     def __len__(self):
@@ -1,4 +1,5 @@
 from discord.errors import HTTPException
+from asyncio import TimeoutError
 from contextlib import suppress
 
 
@@ -18,3 +19,22 @@ async def get_fetch_guild(bot, guild_id):
             guild = await bot.fetch_guild(guild_id)
 
     return guild
+
+
+async def get_fetch_members(guild, user_ids):
+    """Returns user_id -> member for the found members, querying the missing ones in one batch."""
+    members, missing = {}, []
+    for user_id in user_ids:
+        member = guild.get_member(user_id)
+        if member:
+            members[user_id] = member
+        else:
+            missing.append(user_id)
+
+    if missing:
+        with suppress(HTTPException, TimeoutError):
+            # Gateway query, up to 100 users at once
+            for member in await guild.query_members(user_ids=missing[:100], cache=True):
+                members[member.id] = member
+
+    return members
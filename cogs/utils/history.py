@@ -0,0 +1,108 @@
+"""
+Maintenance of the time bucketed stats history, see migrations/0003_radio_stats_history.sql
+Hourly stats are partitioned by month, so old hours are dropped a partition at a time,
+and they are rolled up into weekly and monthly stats, which are kept much longer.
+"""
+import re
+from datetime import date
+
+from .migrations import MIGRATIONS_LOCK_ID
+
+HOURLY_PARTITION_NAME = 'radio_stats_hourly_y{:04d}m{:02d}'
+HOURLY_PARTITION_REGX = re.compile(r'^radio_stats_hourly_y(\d{4})m(\d{2})$')
+
+# Recounts the current and the previous period, as the previous rollup
+# could have missed the last hour of it. Old partitions are skipped.
+WEEKLY_ROLLUP_QUERY = """
+    INSERT INTO radio_stats_weekly(week, user_id, guild_id, listening_minutes, song_requests)
+    SELECT date_trunc('week', bucket)::date, user_id, guild_id, sum(listening_minutes), sum(song_requests)
+    FROM radio_stats_hourly
+    WHERE bucket >= date_trunc('week', now()) - interval '1 week'
+    GROUP BY 1, 2, 3
+    ON CONFLICT (guild_id, week, user_id)
+    DO UPDATE
+    SET listening_minutes = EXCLUDED.listening_minutes,
+        song_requests = EXCLUDED.song_requests;
+    """
+
+MONTHLY_ROLLUP_QUERY = """
+    INSERT INTO radio_stats_monthly(month, user_id, guild_id, listening_minutes, song_requests)
+    SELECT date_trunc('month', bucket)::date, user_id, guild_id, sum(listening_minutes), sum(song_requests)
+    FROM radio_stats_hourly
+    WHERE bucket >= date_trunc('month', now()) - interval '1 month'
+    GROUP BY 1, 2, 3
+    ON CONFLICT (guild_id, month, user_id)
+    DO UPDATE
+    SET listening_minutes = EXCLUDED.listening_minutes,
+        song_requests = EXCLUDED.song_requests;
+    """
+
+
+def add_months(day: date, months: int) -> date:
+    """Returns the first day of the month, that is ``months`` away from the month of ``day``"""
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    return date(year, month + 1, 1)
+
+
+async def ensure_partitions(pool, months_ahead: int = 1) -> None:
+    """Creates the hourly stats partitions for this month and the months ahead"""
+    today = date.today()
+
+    async with pool.acquire() as connection:
+        # Concurrent CREATE TABLE IF NOT EXISTS of the same table can still fail,
+        # so the processes take turns, like with the migrations
+        await connection.execute("SELECT pg_advisory_lock($1);", MIGRATIONS_LOCK_ID)
+        try:
+            for i in range(months_ahead + 1):
+                start, end = add_months(today, i), add_months(today, i + 1)
+                name = HOURLY_PARTITION_NAME.format(start.year, start.month)
+                await connection.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {name}
+                    PARTITION OF radio_stats_hourly
+                    FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');
+                    """
+                )
+        finally:
+            await connection.execute("SELECT pg_advisory_unlock($1);", MIGRATIONS_LOCK_ID)
+
+
+async def rollup(pool) -> None:
+    async with pool.acquire() as connection:
+        async with connection.transaction():
+            await connection.execute(WEEKLY_ROLLUP_QUERY)
+            await connection.execute(MONTHLY_ROLLUP_QUERY)
+
+
+async def prune(pool, hourly_months: int, weekly_weeks: int) -> list:
+    """Drops the hourly partitions older than ``hourly_months`` full months and
+    deletes the weekly stats older than ``weekly_weeks``. Monthly stats are kept.
+    Returns the names of the dropped partitions.
+    """
+    partitions = await pool.fetch(
+        """
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'radio_stats_hourly';
+        """
+    )
+    oldest_kept = add_months(date.today(), -hourly_months)
+
+    dropped = []
+    for row in partitions:
+        match = HOURLY_PARTITION_REGX.match(row['relname'])
+        if not match:
+            continue
+
+        if date(int(match.group(1)), int(match.group(2)), 1) < oldest_kept:
+            # Way cheaper than deleting the rows
+            await pool.execute(f"DROP TABLE IF EXISTS {row['relname']};")
+            dropped.append(row['relname'])
+
+    await pool.execute(
+        "DELETE FROM radio_stats_weekly WHERE week < current_date - make_interval(weeks => $1);",
+        weekly_weeks
+    )
+
+    return dropped
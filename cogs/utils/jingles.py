@@ -0,0 +1,70 @@
+import os
+import random
+import asyncio
+from os.path import join as path_join
+
+
+class JingleCatalog:
+    """Keeps the jingles resolved as Lavalink tracks, so queueing a jingle needs no I/O.
+
+    Directories are relative to ``root``, the root directory itself being ``''``.
+    :meth:`refresh` rescans the directories and resolves only the new or changed files.
+    """
+
+    def __init__(self, root: str, **options) -> None:
+        self.root = root
+        self.loop = options.pop('loop', asyncio.get_event_loop())
+        # Directory -> {file name: (mtime, track)}
+        self._files = {}
+        # Directory -> list of tracks, for cheap random choices
+        self._tracks = {}
+
+    def _scan(self, directories) -> dict:
+        scanned = {}
+        for directory in directories:
+            files = {}
+            try:
+                with os.scandir(path_join(self.root, directory)) as entries:
+                    for entry in entries:
+                        # The root directory has subdirectories for programme jingles
+                        if entry.is_file():
+                            files[entry.name] = entry.stat().st_mtime
+            except OSError:
+                pass
+
+            scanned[directory] = files
+
+        return scanned
+
+    async def refresh(self, directories, get_tracks) -> None:
+        scanned = await self.loop.run_in_executor(None, self._scan, set(directories))
+
+        for directory, files in scanned.items():
+            known = self._files.get(directory, {})
+            fresh = {}
+
+            for name, mtime in files.items():
+                entry = known.get(name)
+                if entry and entry[0] == mtime:
+                    fresh[name] = entry
+                    continue
+
+                try:
+                    results = await get_tracks(path_join(self.root, directory, name))
+                except Exception:
+                    # Try again with the next refresh
+                    continue
+
+                if results and results['tracks']:
+                    fresh[name] = (mtime, results['tracks'][0])
+
+            self._files[directory] = fresh
+            self._tracks[directory] = [track for _, track in fresh.values()]
+
+    def choose(self, directory: str = ''):
+        """Returns a random jingle track of the directory, or None if there are no jingles."""
+        tracks = self._tracks.get(directory)
+        if not tracks:
+            return None
+
+        return random.choice(tracks)
@@ -0,0 +1,96 @@
+import time
+
+
+class Leaderboard:
+    """Top listeners and requesters of a guild."""
+
+    __slots__ = ('fetched_at', 'minutes', 'requests')
+
+    def __init__(self, minutes: dict, requests: dict) -> None:
+        self.fetched_at = time.monotonic()
+        # user_id -> listening minutes / song requests
+        self.minutes = minutes
+        self.requests = requests
+
+    @staticmethod
+    def _top(values: dict, size: int) -> list:
+        return sorted(values.items(), key=lambda item: item[1], reverse=True)[:size]
+
+    def top_minutes(self, size: int) -> list:
+        return self._top(self.minutes, size)
+
+    def top_requests(self, size: int) -> list:
+        return self._top(self.requests, size)
+
+    def user_ids(self) -> set:
+        return self.minutes.keys() | self.requests.keys()
+
+
+class LeaderboardCache:
+    """Leaderboards and user stats per guild, kept for ``ttl`` seconds.
+
+    Stats increments are written through to the cached entries with :meth:`add`,
+    so the cached values stay current between the refreshes.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        # guild_id -> Leaderboard
+        self._boards = {}
+        # (guild_id, user_id) -> [fetched at, listening minutes, song requests]
+        self._users = {}
+        # user_id -> display name
+        self.names = {}
+
+    def _is_fresh(self, fetched_at: float) -> bool:
+        return time.monotonic() - fetched_at < self.ttl
+
+    def get_board(self, guild_id: int):
+        board = self._boards.get(guild_id)
+        if board and self._is_fresh(board.fetched_at):
+            return board
+
+        return None
+
+    def set_board(self, guild_id: int, minutes: dict, requests: dict) -> Leaderboard:
+        board = self._boards[guild_id] = Leaderboard(minutes, requests)
+        self._prune()
+        return board
+
+    def _prune(self) -> None:
+        """Forgets the expired entries, and the names no leaderboard shows anymore."""
+        for guild_id in [key for key, board in self._boards.items() if not self._is_fresh(board.fetched_at)]:
+            del self._boards[guild_id]
+
+        for key in [key for key, entry in self._users.items() if not self._is_fresh(entry[0])]:
+            del self._users[key]
+
+        shown = set().union(*(board.user_ids() for board in self._boards.values()))
+        for user_id in self.names.keys() - shown:
+            del self.names[user_id]
+
+    def get_user(self, guild_id: int, user_id: int):
+        """Returns cached (listening minutes, song requests) of the user or None."""
+        entry = self._users.get((guild_id, user_id))
+        if entry and self._is_fresh(entry[0]):
+            return entry[1], entry[2]
+
+        return None
+
+    def set_user(self, guild_id: int, user_id: int, minutes: float, requests: int) -> None:
+        self._users[(guild_id, user_id)] = [time.monotonic(), minutes, requests]
+
+    def add(self, user_id: int, guild_id: int, minutes: float = 0, requests: int = 0) -> None:
+        entry = self._users.get((guild_id, user_id))
+        if entry:
+            entry[1] += minutes
+            entry[2] += requests
+
+        board = self._boards.get(guild_id)
+        if board:
+            # Users outside of the leaderboard show up with the next refresh
+            if minutes and user_id in board.minutes:
+                board.minutes[user_id] += minutes
+
+            if requests and user_id in board.requests:
+                board.requests[user_id] += requests
@@ -0,0 +1,61 @@
+import time
+
+
+class ListeningTracker:
+    """Keeps the listening sessions of members, driven by voice state updates.
+
+    A session starts when a member starts listening and its time is taken
+    either when it stops or on :meth:`checkpoint`, so the totals are
+    second-accurate without scanning the voice channels periodically.
+    """
+
+    def __init__(self) -> None:
+        # (guild_id, user_id) -> [channel_id, session start or last checkpoint]
+        self._sessions = {}
+        # channel_id -> set of user ids listening in it
+        self._listeners = {}
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._sessions
+
+    def start(self, guild_id: int, user_id: int, channel_id: int) -> None:
+        if (guild_id, user_id) in self._sessions:
+            return
+
+        self._sessions[(guild_id, user_id)] = [channel_id, time.monotonic()]
+        self._listeners.setdefault(channel_id, set()).add(user_id)
+
+    def stop(self, guild_id: int, user_id: int) -> float:
+        """Ends the session and returns its not yet taken seconds."""
+        session = self._sessions.pop((guild_id, user_id), None)
+        if not session:
+            return 0
+
+        channel_id, started = session
+        listeners = self._listeners[channel_id]
+        listeners.discard(user_id)
+        if not listeners:
+            del self._listeners[channel_id]
+
+        return time.monotonic() - started
+
+    def stop_guild(self, guild_id: int) -> list:
+        """Ends all sessions in the guild and returns their user ids and seconds."""
+        user_ids = [user_id for session_guild_id, user_id in self._sessions if session_guild_id == guild_id]
+
+        return [(user_id, self.stop(guild_id, user_id)) for user_id in user_ids]
+
+    def checkpoint(self) -> list:
+        """Returns (user_id, guild_id, seconds) of every session since its last checkpoint."""
+        now = time.monotonic()
+
+        taken = []
+        for (guild_id, user_id), session in self._sessions.items():
+            taken.append((user_id, guild_id, now - session[1]))
+            session[1] = now
+
+        return taken
+
+    def listeners(self, channel_id: int) -> int:
+        """Returns the amount of members currently listening in the channel."""
+        return len(self._listeners.get(channel_id, ()))
@@ -0,0 +1,65 @@
+import os
+import re
+
+MIGRATION_FILE_REGX = re.compile(r'^(\d+)_(\w+)\.sql$')
+# Any constant, just has to be the same for all the bot processes
+MIGRATIONS_LOCK_ID = 0x7261646F
+
+
+def read_migrations(directory: str) -> list:
+    """Returns sorted (version, name, sql) of the migration files, named like 0001_name.sql"""
+    migrations = []
+    for file_name in os.listdir(directory):
+        match = MIGRATION_FILE_REGX.match(file_name)
+        if not match:
+            continue
+
+        with open(os.path.join(directory, file_name), encoding='utf-8') as f:
+            migrations.append((int(match.group(1)), match.group(2), f.read()))
+
+    migrations.sort()
+
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+
+    return migrations
+
+
+async def migrate(pool, directory: str, log) -> int:
+    """Applies the not yet applied migrations, each in its own transaction.
+    Returns the schema version.
+    """
+    migrations = read_migrations(directory)
+
+    async with pool.acquire() as connection:
+        # Only one process migrates at a time
+        await connection.execute("SELECT pg_advisory_lock($1);", MIGRATIONS_LOCK_ID)
+        try:
+            await connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations(
+                    version integer PRIMARY KEY,
+                    name text NOT NULL,
+                    applied_at timestamptz NOT NULL DEFAULT now()
+                );
+                """
+            )
+            current = await connection.fetchval("SELECT max(version) FROM schema_migrations;") or 0
+
+            for version, name, sql in migrations:
+                if version <= current:
+                    continue
+
+                async with connection.transaction():
+                    await connection.execute(sql)
+                    await connection.execute(
+                        "INSERT INTO schema_migrations(version, name) VALUES ($1, $2);", version, name
+                    )
+
+                current = version
+                log.info(f"Applied database migration {version} {name}")
+        finally:
+            await connection.execute("SELECT pg_advisory_unlock($1);", MIGRATIONS_LOCK_ID)
+
+    return current
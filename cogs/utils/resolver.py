@@ -0,0 +1,103 @@
+import time
+import asyncio
+from dataclasses import dataclass
+
+
+@dataclass
+class ResolveProgress:
+    resolved: int = 0
+    failed: int = 0
+    pending: int = 0
+
+
+class TokenBucket:
+    """Token bucket rate limiter, which adapts its rate to the failures.
+
+    Every failure halves the rate (down to ``min_rate``), every success
+    adds back a tenth of the configured rate.
+    """
+
+    def __init__(self, rate: float, capacity: int, min_rate: float) -> None:
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+
+            self.tokens -= 1
+
+    def back_off(self) -> None:
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        # Drop the burst, so the next requests really are slower
+        self.tokens = min(self.tokens, 0)
+
+    def recover(self) -> None:
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class PlaylistResolver:
+    """Resolves playlist lines through Lavalink with bounded concurrency and a rate limit."""
+
+    def __init__(self, *, concurrency: int, rate: float, burst: int, min_rate: float, retries: int) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst, min_rate)
+        self.retries = retries
+        # Playlist name -> ResolveProgress of the last load
+        self.progress = {}
+
+    async def resolve_query(self, get_tracks, query: str):
+        """Returns the list of tracks, an empty list when nothing matches or None on failure."""
+        for _ in range(self.retries + 1):
+            await self.bucket.acquire()
+
+            async with self.semaphore:
+                try:
+                    results = await get_tracks(query)
+                except Exception:
+                    results = None
+
+            if results and results['loadType'] != 'LOAD_FAILED' and results['tracks']:
+                self.bucket.recover()
+                return results['tracks']
+
+            # Empty or failed results are the usual sign of getting rate limited
+            self.bucket.back_off()
+
+            if results and results['loadType'] == 'NO_MATCHES':
+                return []
+
+        return None
+
+    async def resolve(self, name: str, queries: list, get_tracks, on_resolved, already_resolved: int = 0) -> None:
+        """Resolves all queries, awaiting ``on_resolved(query, tracks)`` as soon as each one is done."""
+        progress = ResolveProgress(resolved=already_resolved, pending=len(queries))
+        self.progress[name] = progress
+
+        async def resolve_one(query):
+            tracks = await self.resolve_query(get_tracks, query)
+
+            progress.pending -= 1
+            if tracks is None:
+                progress.failed += 1
+            else:
+                progress.resolved += 1
+
+            await on_resolved(query, tracks)
+
+        await asyncio.gather(*(resolve_one(query) for query in queries))
@@ -0,0 +1,124 @@
+import time
+import random
+from collections import deque
+
+
+class Cooldown:
+    """Remembers recently played track identifiers.
+
+    A track stays on cooldown until ``count`` other tracks were played after it,
+    or for ``seconds`` after it was played, whichever is longer. Either window
+    can be disabled with 0. One instance can be shared by many players.
+    """
+
+    def __init__(self, count: int = 0, seconds: float = 0) -> None:
+        self.count = count
+        self.seconds = seconds
+        # Ring buffer of the last played identifiers and the same as a set
+        self._recent = deque()
+        self._recent_set = set()
+        # Identifier -> monotonic time when it comes off the cooldown
+        self._expires = {}
+        self._expiry_order = deque()
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._expiry_order and self._expiry_order[0][0] <= now:
+            expires, identifier = self._expiry_order.popleft()
+            # The track could have been played again later
+            if self._expires.get(identifier) == expires:
+                del self._expires[identifier]
+
+    def __contains__(self, identifier: str) -> bool:
+        if identifier in self._recent_set:
+            return True
+
+        if self._expires:
+            self._expire()
+            return identifier in self._expires
+
+        return False
+
+    def add(self, identifier: str) -> None:
+        if self.count and identifier not in self._recent_set:
+            if len(self._recent) >= self.count:
+                self._recent_set.discard(self._recent.popleft())
+
+            self._recent.append(identifier)
+            self._recent_set.add(identifier)
+
+        if self.seconds:
+            expires = time.monotonic() + self.seconds
+            self._expires[identifier] = expires
+            self._expiry_order.append((expires, identifier))
+
+    def remove(self, identifier: str) -> None:
+        """Takes a track off the cooldown, for example when it was planned but not played after all."""
+        if identifier in self._recent_set:
+            self._recent.remove(identifier)
+            self._recent_set.discard(identifier)
+
+        # Its entry in the expiry order is skipped then
+        self._expires.pop(identifier, None)
+
+
+class ShuffleBag:
+    """Draws tracks of a list in a random order, without repeats until the bag is empty."""
+
+    def __init__(self, tracks: list) -> None:
+        self.tracks = tracks
+        self._bag = []
+
+    def draw(self, is_eligible):
+        skipped = []
+        refilled = False
+
+        try:
+            while True:
+                if not self._bag:
+                    if refilled or not self.tracks:
+                        return None
+
+                    # New tracks loaded meanwhile show up with the next refill
+                    self._bag = self.tracks[:]
+                    random.shuffle(self._bag)
+                    refilled = True
+                    # These are in the new bag already
+                    skipped = []
+
+                track = self._bag.pop()
+                if is_eligible(track):
+                    return track
+
+                skipped.append(track)
+        finally:
+            # Skipped tracks stay in the bag, they will be drawn after the others
+            self._bag[:0] = skipped
+
+
+class Rotation:
+    """Auto queue rotation of a player: a shuffle bag per track list and a cooldown.
+
+    The track lists are expected to contain only playable tracks.
+    """
+
+    def __init__(self, cooldown: Cooldown) -> None:
+        self.cooldown = cooldown
+        # Track list name -> ShuffleBag
+        self._bags = {}
+
+    def is_eligible(self, track: dict) -> bool:
+        return track['info']['identifier'] not in self.cooldown
+
+    def draw(self, name: str, tracks: list):
+        """Returns an eligible track from the list and puts it on cooldown, or None if there is none."""
+        bag = self._bags.get(name)
+        # The list gets replaced on reloads and programme changes
+        if bag is None or bag.tracks is not tracks:
+            bag = self._bags[name] = ShuffleBag(tracks)
+
+        track = bag.draw(self.is_eligible)
+        if track:
+            self.cooldown.add(track['info']['identifier'])
+
+        return track
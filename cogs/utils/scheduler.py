@@ -0,0 +1,198 @@
+import time
+import bisect
+import asyncio
+import traceback
+from dataclasses import dataclass
+
+
+MINUTES_PER_DAY = 1440
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def minute_of_week(tm) -> int:
+    """Converts ``time.struct_time`` to the minute of the week, Monday 0:00 being 0."""
+    return tm.tm_wday * MINUTES_PER_DAY + tm.tm_hour * 60 + tm.tm_min
+
+
+class ScheduleIndex:
+    """Sorted minute-of-week interval table of programme play times.
+
+    Every play time needs ``start_minute`` and ``end_minute`` attributes.
+    Play times that wrap around the end of the week are split in two.
+    Overlapping play times are rejected with :exc:`ValueError`.
+    """
+
+    def __init__(self, programmes) -> None:
+        intervals, starts = [], []
+        for programme in programmes:
+            for play_time in programme.play_times:
+                start, end = play_time.start_minute, play_time.end_minute
+                if start == end:
+                    raise ValueError(f"Programme {programme.title} has an empty play time")
+
+                if start < end:
+                    intervals.append((start, end, programme, play_time))
+                else:
+                    intervals.append((start, MINUTES_PER_WEEK, programme, play_time))
+                    if end > 0:
+                        intervals.append((0, end, programme, play_time))
+
+                starts.append((start, programme, play_time))
+
+        intervals.sort(key=lambda interval: interval[0])
+        for previous, interval in zip(intervals, intervals[1:]):
+            if previous[1] > interval[0]:
+                raise ValueError(
+                    f"Programme {previous[2].title} overlaps with programme {interval[2].title}"
+                )
+
+        starts.sort(key=lambda start: start[0])
+
+        self._intervals = intervals
+        self._interval_starts = [interval[0] for interval in intervals]
+        self._starts = starts
+        self._start_minutes = [start[0] for start in starts]
+
+    def at(self, minute: int) -> tuple:
+        """Returns the programme, its play time and minutes until it ends, or Nones if nothing is on."""
+        index = bisect.bisect_right(self._interval_starts, minute) - 1
+        if index >= 0:
+            start, end, programme, play_time = self._intervals[index]
+            if minute < end:
+                return programme, play_time, (play_time.end_minute - minute) % MINUTES_PER_WEEK
+
+        return None, None, None
+
+    def next(self, minute: int) -> tuple:
+        """Returns the programme and play time starting next after this minute and minutes until it starts."""
+        if not self._starts:
+            return None, None, None
+
+        index = bisect.bisect_right(self._start_minutes, minute)
+        if index == len(self._starts):
+            # Wrap around to the next week
+            index = 0
+
+        start, programme, play_time = self._starts[index]
+        return programme, play_time, (start - minute - 1) % MINUTES_PER_WEEK + 1
+
+
+@dataclass
+class ScheduleState:
+    programme: object = None
+    play_time: object = None
+    next_programme: object = None
+    next_play_time: object = None
+    # Seconds until the next programme starts
+    next_starts_in: float = None
+    # Seconds until the current programme ends
+    ends_in: float = None
+
+
+class ProgrammeScheduler:
+    """Sleeps until the next programme boundary instead of polling the schedule.
+
+    ``find_state`` is called only at boundaries, when :meth:`reschedule` is called
+    or when the wall clock jumps (NTP adjustments, DST changes). The callbacks are
+    coroutines: ``on_update(state)`` after every recompute, ``on_start(programme,
+    play_time)`` and ``on_end(programme)`` when the programme on air changes.
+    """
+
+    # How often to check for wall clock jumps while sleeping, in seconds
+    CLOCK_CHECK_INTERVAL = 60
+    # Wall clock drift, in seconds, that counts as a jump
+    CLOCK_JUMP_TOLERANCE = 5
+
+    def __init__(self, find_state, *, on_update, on_start, on_end, lead_time: float, log, loop) -> None:
+        self.find_state = find_state
+        self.on_update = on_update
+        self.on_start = on_start
+        self.on_end = on_end
+        # Extra wake up this many seconds before each programme starts
+        self.lead_time = lead_time
+        self.log = log
+        self.loop = loop
+
+        self.state = ScheduleState()
+        self._changed = asyncio.Event()
+        self._task = None
+
+    @staticmethod
+    def _clock_offset() -> float:
+        # Local wall clock relative to the monotonic clock
+        return time.time() + time.localtime().tm_gmtoff - time.monotonic()
+
+    def start(self) -> None:
+        if not self._task:
+            self._task = self.loop.create_task(self.run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def reschedule(self) -> None:
+        """Recompute the schedule right away, for example after the schedule was changed."""
+        self._changed.set()
+
+    def _next_wake_up(self, state: ScheduleState) -> float:
+        candidates = []
+        if state.ends_in is not None:
+            candidates.append(state.ends_in)
+
+        if state.next_starts_in is not None:
+            candidates.append(state.next_starts_in)
+            if state.next_starts_in > self.lead_time:
+                candidates.append(state.next_starts_in - self.lead_time)
+
+        return min(candidates, default=self.CLOCK_CHECK_INTERVAL)
+
+    async def _dispatch(self, state: ScheduleState) -> None:
+        old = self.state
+        self.state = state
+
+        if (old.programme, old.play_time) != (state.programme, state.play_time):
+            if old.programme:
+                await self.on_end(old.programme)
+
+            if state.programme:
+                await self.on_start(state.programme, state.play_time)
+
+        await self.on_update(state)
+
+    async def apply(self, state: ScheduleState) -> None:
+        """Dispatches a state found elsewhere, for example by another process, while not running."""
+        await self._dispatch(state)
+
+    async def _sleep(self, seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+        clock = self._clock_offset()
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=min(remaining, self.CLOCK_CHECK_INTERVAL))
+                return
+            except asyncio.TimeoutError:
+                pass
+
+            if abs(self._clock_offset() - clock) > self.CLOCK_JUMP_TOLERANCE:
+                self.log.info("Wall clock jump detected, recomputing the programme schedule")
+                return
+
+    async def run(self) -> None:
+        while True:
+            self._changed.clear()
+
+            try:
+                state = self.find_state()
+                await self._dispatch(state)
+                wake_up = self._next_wake_up(state)
+            except Exception:
+                self.log.error(traceback.format_exc())
+                wake_up = self.CLOCK_CHECK_INTERVAL
+
+            await self._sleep(max(wake_up, 1))
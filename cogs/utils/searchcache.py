@@ -0,0 +1,90 @@
+import time
+import asyncio
+from collections import OrderedDict
+
+
+class SearchCache:
+    """Size-bounded LRU cache of Lavalink search results, with expiry.
+
+    Results without tracks (``NO_MATCHES``) are cached too, for ``negative_ttl``
+    seconds. Failed lookups are never cached. Concurrent lookups of the same
+    key share a single Lavalink request.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # Key -> (expires at, results), least recently used first
+        self._entries = OrderedDict()
+        # Key -> future of a lookup in progress
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires, results = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return results
+
+    def put(self, key: str, results: dict) -> None:
+        if results.get('loadType') == 'NO_MATCHES':
+            ttl = self.negative_ttl
+        elif results.get('tracks'):
+            ttl = self.ttl
+        else:
+            # LOAD_FAILED and the like, might work next time
+            return
+
+        self._entries[key] = (time.monotonic() + ttl, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_tracks(self, key: str, get_tracks):
+        """Returns the cached results of the query or looks them up with ``get_tracks``.
+        The returned results are shared, so they must not be modified.
+        """
+        results = self.get(key)
+        if results is not None:
+            self.hits += 1
+            return results
+
+        pending = self._pending.get(key)
+        if pending:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = self._pending[key] = asyncio.get_event_loop().create_future()
+        try:
+            results = await get_tracks(key)
+        except Exception as e:
+            future.set_exception(e)
+            # Only the waiting lookups should get the exception
+            future.exception()
+            raise
+        else:
+            if results:
+                self.put(key, results)
+            future.set_result(results)
+            return results
+        finally:
+            if not future.done():
+                # Cancelled
+                future.cancel()
+            del self._pending[key]
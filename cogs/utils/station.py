@@ -0,0 +1,54 @@
+from os.path import join as path_join
+
+from .broadcast import StationTimeline
+from .rotation import Rotation
+
+
+class Station:
+    """One radio station: its programme schedule, auto queue catalog, cooldowns and jingles.
+
+    Guilds and voice channels subscribe to a station. The catalog of a station
+    is loaded once and shared by all the players listening to it.
+    """
+
+    def __init__(self, name: str, *, programmes_file_path: str, playlists_directory: str,
+                 jingles_directory: str, create_cooldown) -> None:
+        self.name = name
+        self.programmes_file_path = programmes_file_path
+        # Under the playlists and jingles root directories, '' for the roots themselves
+        self.playlists_directory = playlists_directory
+        self.jingles_directory = jingles_directory
+
+        self.all_programmes, self.schedule_index = (), None
+        self.scheduler = None
+        # Current programme and current playtime for programme
+        self.programme, self.programme_play_time = None, None
+        # Next up
+        self.nearest_programme, self.nearest_play_time = None, None
+
+        # Loaded Lavalink.py track objects
+        self.tracks_programme = []
+        self.tracks_low = []
+        self.tracks_medium = []
+        self.tracks_high = []
+        # Playlist key -> tracks of the current and the upcoming programme
+        self.programme_tracks = {}
+        # If we are currently loading some auto queue tracks
+        self.loading_tracks = False
+        # Monotonic time when a cluster follower may read the playlists again
+        self.catalog_retry_at = 0
+        # Used by all the players of the station, when the cooldown is shared
+        self.shared_cooldown = create_cooldown()
+
+        # Broadcast mode: the tracks are picked once for the whole station
+        self.broadcast = StationTimeline()
+        self.broadcast_rotation = Rotation(create_cooldown())
+        self.broadcast_jingle = 0
+        self.broadcast_task = None
+
+    def __repr__(self) -> str:
+        return f'<Station {self.name}>'
+
+    def playlist_key(self, filename: str) -> str:
+        """Path of the playlist file under the playlists root, the same for all the stations using it"""
+        return path_join(self.playlists_directory, filename)
@@ -0,0 +1,262 @@
+import time
+import datetime
+
+
+class StatsBuffer:
+    """Coalesces radio stats increments in memory and writes them in batches.
+
+    Increments are keyed by (user_id, guild_id), so a flush is a single
+    set-based upsert, no matter how many increments were made meanwhile.
+    Listening time is kept in seconds, only whole minutes get written and
+    the rest is kept aside for the next flush, as long as the user keeps
+    listening. The flushed increments are also added to the hourly stats
+    history of the current hour.
+    """
+
+    # Drop the leftover seconds of a user, if nothing was added for this long
+    LEFTOVER_SECONDS = 300
+
+    FLUSH_QUERY = """
+        INSERT INTO radio_stats(user_id, guild_id, listening_minutes, song_requests)
+        SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::integer[], $4::integer[])
+        ON CONFLICT (user_id, guild_id)
+        DO UPDATE
+        SET listening_minutes = radio_stats.listening_minutes + EXCLUDED.listening_minutes,
+            song_requests = radio_stats.song_requests + EXCLUDED.song_requests;
+        """
+
+    HISTORY_FLUSH_QUERY = """
+        INSERT INTO radio_stats_hourly(bucket, user_id, guild_id, listening_minutes, song_requests)
+        SELECT date_trunc('hour', now()), *
+        FROM unnest($1::bigint[], $2::bigint[], $3::integer[], $4::integer[])
+        ON CONFLICT (guild_id, user_id, bucket)
+        DO UPDATE
+        SET listening_minutes = radio_stats_hourly.listening_minutes + EXCLUDED.listening_minutes,
+            song_requests = radio_stats_hourly.song_requests + EXCLUDED.song_requests;
+        """
+
+    def __init__(self) -> None:
+        # (user_id, guild_id) -> [listening seconds, song requests]
+        self._pending = {}
+        # (user_id, guild_id) -> [seconds under a minute left from the last flush, monotonic time then]
+        self._leftover = {}
+
+    def __len__(self) -> int:
+        # The leftovers are not worth a flush
+        return len(self._pending)
+
+    def add(self, user_id: int, guild_id: int, seconds: float = 0, requests: int = 0) -> None:
+        leftover = self._leftover.pop((user_id, guild_id), None)
+        if leftover:
+            seconds += leftover[0]
+
+        counters = self._pending.get((user_id, guild_id))
+        if counters is None:
+            self._pending[(user_id, guild_id)] = [seconds, requests]
+        else:
+            counters[0] += seconds
+            counters[1] += requests
+
+    def get(self, user_id: int, guild_id: int) -> tuple:
+        """Returns the not yet written minutes and song requests of a user."""
+        seconds, requests = self._pending.get((user_id, guild_id), (0, 0))
+        leftover = self._leftover.get((user_id, guild_id))
+        if leftover:
+            seconds += leftover[0]
+
+        return int(seconds // 60), requests
+
+    def take(self) -> list:
+        """Removes and returns all pending increments as (user_id, guild_id, seconds, requests)."""
+        pending, self._pending = self._pending, {}
+        return [(user_id, guild_id, seconds, requests) for (user_id, guild_id), (seconds, requests) in pending.items()]
+
+    def merge(self, rows: list) -> None:
+        for user_id, guild_id, seconds, requests in rows:
+            self.add(user_id, guild_id, seconds, requests)
+
+    async def flush(self, pool) -> int:
+        """Writes all pending increments. Returns the amount of written rows."""
+        now = time.monotonic()
+        # The users who stopped listening won't add the rest up to a minute anymore
+        for key in [key for key, (_, since) in self._leftover.items() if now - since > self.LEFTOVER_SECONDS]:
+            del self._leftover[key]
+
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+
+        columns = ([], [], [], [])
+        for (user_id, guild_id), (seconds, requests) in pending.items():
+            minutes, seconds = divmod(seconds, 60)
+            if seconds:
+                self._leftover[(user_id, guild_id)] = [seconds, now]
+
+            if minutes or requests:
+                for column, value in zip(columns, (user_id, guild_id, int(minutes), requests)):
+                    column.append(value)
+
+        if not columns[0]:
+            return 0
+
+        try:
+            async with pool.acquire() as connection:
+                async with connection.transaction():
+                    # asyncpg prepares and caches the statements per connection
+                    await connection.execute(self.FLUSH_QUERY, *columns)
+                    await connection.execute(self.HISTORY_FLUSH_QUERY, *columns)
+        except Exception:
+            # Keep the increments for the next flush
+            for user_id, guild_id, minutes, requests in zip(*columns):
+                self.add(user_id, guild_id, seconds=minutes * 60, requests=requests)
+            raise
+
+        return len(columns[0])
+
+
+class AirtimeStats:
+    """Attributes the listening time in guilds to the programme and the track on air.
+
+    Each guild has a segment of what is on air and how many are listening,
+    every change closes the segment and adds its listener-seconds to the
+    pending stats of that day, which are written in batches like :class:`StatsBuffer`.
+    """
+
+    PROGRAMMES_FLUSH_QUERY = """
+        INSERT INTO radio_programme_listening(day, guild_id, programme, listening_seconds)
+        SELECT * FROM unnest($1::date[], $2::bigint[], $3::text[], $4::bigint[])
+        ON CONFLICT (guild_id, day, programme)
+        DO UPDATE
+        SET listening_seconds = radio_programme_listening.listening_seconds + EXCLUDED.listening_seconds;
+        """
+
+    TRACKS_FLUSH_QUERY = """
+        INSERT INTO radio_track_listening(day, guild_id, track_identifier, track_title, listening_seconds)
+        SELECT * FROM unnest($1::date[], $2::bigint[], $3::text[], $4::text[], $5::bigint[])
+        ON CONFLICT (guild_id, day, track_identifier)
+        DO UPDATE
+        SET listening_seconds = radio_track_listening.listening_seconds + EXCLUDED.listening_seconds;
+        """
+
+    def __init__(self) -> None:
+        # guild_id -> [programme title, track identifier, track title, listeners, segment start]
+        self._on_air = {}
+        # (day, guild_id, programme title) -> listener-seconds
+        self._programmes = {}
+        # (day, guild_id, track identifier) -> [track title, listener-seconds]
+        self._tracks = {}
+
+    def _close_segment(self, guild_id: int, now: float) -> None:
+        segment = self._on_air.get(guild_id)
+        if not segment:
+            return
+
+        programme, identifier, title, listeners, started = segment
+        segment[4] = now
+
+        seconds = listeners * (now - started)
+        if seconds <= 0:
+            return
+
+        # The day the listening happened, not the day it gets written
+        day = datetime.date.today()
+        key = (day, guild_id, programme)
+        self._programmes[key] = self._programmes.get(key, 0) + seconds
+
+        if identifier:
+            track = self._tracks.get((day, guild_id, identifier))
+            if track is None:
+                self._tracks[(day, guild_id, identifier)] = [title, seconds]
+            else:
+                track[1] += seconds
+
+    def update(self, guild_id: int, programme: str, track, listeners: int) -> None:
+        """Closes the current segment of the guild and starts a new one.
+        ``track`` is the Lavalink.py track on air or None.
+        """
+        now = time.monotonic()
+        self._close_segment(guild_id, now)
+
+        if listeners:
+            identifier, title = (track.identifier, track.title) if track else (None, None)
+            self._on_air[guild_id] = [programme, identifier, title, listeners, now]
+        else:
+            self._on_air.pop(guild_id, None)
+
+    def checkpoint(self) -> None:
+        """Closes the segments of all guilds, keeping them on air"""
+        now = time.monotonic()
+        for guild_id in self._on_air:
+            self._close_segment(guild_id, now)
+
+    def _take_columns(self) -> tuple:
+        programmes, self._programmes = self._programmes, {}
+        tracks, self._tracks = self._tracks, {}
+        today = datetime.date.today()
+
+        # Only what is still on air can add the rest up to a second
+        def is_on_air(day, guild_id, index, value):
+            segment = self._on_air.get(guild_id)
+            return day == today and segment is not None and segment[index] == value
+
+        programme_columns = ([], [], [], [])
+        for (day, guild_id, programme), seconds in programmes.items():
+            seconds, rest = divmod(seconds, 1)
+            if rest and is_on_air(day, guild_id, 0, programme):
+                self._programmes[(day, guild_id, programme)] = rest
+
+            if seconds:
+                for column, value in zip(programme_columns, (day, guild_id, programme, int(seconds))):
+                    column.append(value)
+
+        track_columns = ([], [], [], [], [])
+        for (day, guild_id, identifier), (title, seconds) in tracks.items():
+            seconds, rest = divmod(seconds, 1)
+            if rest and is_on_air(day, guild_id, 1, identifier):
+                self._tracks[(day, guild_id, identifier)] = [title, rest]
+
+            if seconds:
+                for column, value in zip(track_columns, (day, guild_id, identifier, title, int(seconds))):
+                    column.append(value)
+
+        return programme_columns, track_columns
+
+    def take(self) -> tuple:
+        """Removes and returns the closed segments as (day, guild_id, programme, seconds)
+        and (day, guild_id, track identifier, track title, seconds) rows.
+        """
+        programmes, self._programmes = self._programmes, {}
+        tracks, self._tracks = self._tracks, {}
+
+        return (
+            [(*key, seconds) for key, seconds in programmes.items()],
+            [(*key, title, seconds) for key, (title, seconds) in tracks.items()]
+        )
+
+    def merge(self, programme_rows, track_rows) -> None:
+        for day, guild_id, programme, seconds in programme_rows:
+            key = (day, guild_id, programme)
+            self._programmes[key] = self._programmes.get(key, 0) + seconds
+
+        for day, guild_id, identifier, title, seconds in track_rows:
+            track = self._tracks.setdefault((day, guild_id, identifier), [title, 0])
+            track[1] += seconds
+
+    async def flush(self, pool) -> int:
+        """Writes all the closed segments. Returns the amount of written rows."""
+        programme_columns, track_columns = self._take_columns()
+        if not programme_columns[0] and not track_columns[0]:
+            return 0
+
+        try:
+            async with pool.acquire() as connection:
+                async with connection.transaction():
+                    await connection.execute(self.PROGRAMMES_FLUSH_QUERY, *programme_columns)
+                    await connection.execute(self.TRACKS_FLUSH_QUERY, *track_columns)
+        except Exception:
+            # Keep the stats for the next flush
+            self.merge(zip(*programme_columns), zip(*track_columns))
+            raise
+
+        return len(programme_columns[0]) + len(track_columns[0])
@@ -0,0 +1,57 @@
+import time
+import random
+
+
+class PlayerHealth:
+    """Health of a supervised player, with repair backoff and a circuit breaker.
+
+    Every failed repair makes the player recovering and doubles the delay
+    before the next one, with jitter. After ``park_after`` failures in a row
+    the player is parked: no repairs are tried for ``park_seconds``, then one
+    more, which parks it again if it fails too.
+    """
+
+    HEALTHY = 'healthy'
+    RECOVERING = 'recovering'
+    PARKED = 'parked'
+
+    __slots__ = ('base_delay', 'max_delay', 'park_after', 'park_seconds', 'state', 'failures', 'retry_at')
+
+    def __init__(self, *, base_delay: float, max_delay: float, park_after: int, park_seconds: float) -> None:
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.park_after = park_after
+        self.park_seconds = park_seconds
+
+        self.state = self.HEALTHY
+        # Failed repairs in a row
+        self.failures = 0
+        # Monotonic time of the next repair
+        self.retry_at = 0.0
+
+    def can_repair(self) -> bool:
+        return time.monotonic() >= self.retry_at
+
+    def retry_in(self) -> float:
+        return max(self.retry_at - time.monotonic(), 0)
+
+    def succeeded(self) -> bool:
+        """Marks the player healthy. Returns True, if it was not before."""
+        recovered = self.state != self.HEALTHY
+        self.state, self.failures, self.retry_at = self.HEALTHY, 0, 0.0
+        return recovered
+
+    def failed(self) -> str:
+        """Counts a failed repair and returns the new state."""
+        self.failures += 1
+        if self.failures >= self.park_after:
+            self.state = self.PARKED
+            delay = self.park_seconds
+        else:
+            self.state = self.RECOVERING
+            delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - 1))
+            # The players that broke together shouldn't retry together
+            delay = delay / 2 + random.uniform(0, delay / 2)
+
+        self.retry_at = time.monotonic() + delay
+        return self.state
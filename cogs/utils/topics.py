@@ -0,0 +1,135 @@
+import time
+import asyncio
+import traceback
+from collections import deque
+
+from .resolver import TokenBucket
+
+
+class TopicUpdater:
+    """Background queue of stage channel topic edits.
+
+    Only the latest topic wanted for a channel gets written, and not at all
+    if the channel already has it. The edits are spread out to fit the rate
+    limits, both over all the channels and per channel, and the failed ones
+    are retried later. ``edit(channel_id, topic)`` does the actual edit.
+    """
+
+    def __init__(self, edit, *, concurrency: int, rate: float, burst: int, channel_edits: int,
+                 channel_period: float, retries: int, log, loop) -> None:
+        self.edit = edit
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst, rate / 4)
+        # Max. edits of a channel per period, in seconds
+        self.channel_edits = channel_edits
+        self.channel_period = channel_period
+        self.retries = retries
+        self.log = log
+        self.loop = loop
+
+        # Channel id -> topic last written
+        self._written = {}
+        # Channel id -> topic to write, while it is queued or waiting
+        self._wanted = {}
+        # Channel id -> monotonic times of its recent edits
+        self._edits = {}
+        # Channel id -> failed attempts of the wanted topic
+        self._attempts = {}
+        self._queue = asyncio.Queue()
+        self._workers = []
+
+    def __len__(self) -> int:
+        return len(self._wanted)
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [self.loop.create_task(self._work()) for _ in range(self.concurrency)]
+
+    def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    def update(self, channel_id: int, topic: str) -> None:
+        if channel_id not in self._wanted and self._written.get(channel_id) == topic:
+            return
+
+        queued = channel_id in self._wanted
+        self._wanted[channel_id] = topic
+        # Otherwise it gets the newest topic when its turn comes
+        if not queued:
+            self._queue.put_nowait(channel_id)
+
+    def forget(self, channel_id: int) -> None:
+        """Forgets the topic written to the channel, it could be changed by someone else now"""
+        self._written.pop(channel_id, None)
+
+    def _requeue_later(self, channel_id: int, delay: float) -> None:
+        self.loop.call_later(delay, self._queue.put_nowait, channel_id)
+
+    def _channel_wait(self, channel_id: int) -> float:
+        """Seconds until the channel may be edited again"""
+        edits = self._edits.get(channel_id)
+        if not edits:
+            return 0
+
+        now = time.monotonic()
+        while edits and edits[0] <= now - self.channel_period:
+            edits.popleft()
+
+        if len(edits) < self.channel_edits:
+            if not edits:
+                del self._edits[channel_id]
+            return 0
+
+        return edits[0] + self.channel_period - now
+
+    async def _work(self) -> None:
+        while True:
+            channel_id = await self._queue.get()
+            if channel_id not in self._wanted:
+                continue
+
+            if self._wanted[channel_id] == self._written.get(channel_id):
+                # Changed back meanwhile
+                del self._wanted[channel_id]
+                continue
+
+            wait = self._channel_wait(channel_id)
+            if wait > 0:
+                self._requeue_later(channel_id, wait)
+                continue
+
+            await self.bucket.acquire()
+            topic = self._wanted[channel_id]
+            self._edits.setdefault(channel_id, deque()).append(time.monotonic())
+
+            try:
+                await self.edit(channel_id, topic)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.bucket.back_off()
+                attempts = self._attempts.get(channel_id, 0) + 1
+                if attempts <= self.retries:
+                    self._attempts[channel_id] = attempts
+                    self._requeue_later(channel_id, 2 ** attempts)
+                    continue
+
+                self.log.error(f"Could not change the topic of channel {channel_id}\n{traceback.format_exc()}")
+                self._attempts.pop(channel_id, None)
+                if self._wanted[channel_id] == topic:
+                    del self._wanted[channel_id]
+                else:
+                    # A newer topic gets its own attempts
+                    self._queue.put_nowait(channel_id)
+                continue
+
+            self.bucket.recover()
+            self._attempts.pop(channel_id, None)
+            self._written[channel_id] = topic
+            if self._wanted[channel_id] == topic:
+                del self._wanted[channel_id]
+            else:
+                # Changed while we were writing
+                self._queue.put_nowait(channel_id)
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+import asyncio
+
+
+class TrackCache:
+    """Persistent store of resolved playlist lines. Internally based on ``sqlite3``.
+
+    Every playlist file gets a fingerprint (mtime and content digest) and a
+    row per resolved line, so a restart can rebuild the auto queue track lists
+    without asking Lavalink again. Lines that disappear from a file are
+    dropped the next time the file is stored with a new fingerprint.
+    """
+
+    def __init__(self, name, **options):
+        self.name = name
+        self.loop = options.pop('loop', asyncio.get_event_loop())
+        self.lock = asyncio.Lock()
+
+        # Can be shared by several bot processes
+        self._db = sqlite3.connect(name, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS playlist_files(
+                file_name TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                digest TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS playlist_lines(
+                file_name TEXT NOT NULL,
+                query TEXT NOT NULL,
+                tracks TEXT NOT NULL,
+                PRIMARY KEY (file_name, query)
+            );
+        """)
+        self._db.commit()
+
+    def _fetch_playlist(self, file_name):
+        fingerprint = self._db.execute(
+            "SELECT mtime, digest FROM playlist_files WHERE file_name = ?;", (file_name,)
+        ).fetchone()
+        rows = self._db.execute(
+            "SELECT query, tracks FROM playlist_lines WHERE file_name = ?;", (file_name,)
+        ).fetchall()
+
+        return fingerprint, {query: json.loads(tracks) for query, tracks in rows}
+
+    def _store_playlist(self, file_name, fingerprint, lines):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO playlist_files(file_name, mtime, digest) VALUES (?, ?, ?);",
+                (file_name, *fingerprint)
+            )
+            self._db.execute("DELETE FROM playlist_lines WHERE file_name = ?;", (file_name,))
+            self._db.executemany(
+                "INSERT INTO playlist_lines(file_name, query, tracks) VALUES (?, ?, ?);",
+                [(file_name, query, json.dumps(tracks, separators=(',', ':'))) for query, tracks in lines.items()]
+            )
+
+    def _store_line(self, file_name, query, tracks):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO playlist_lines(file_name, query, tracks) VALUES (?, ?, ?);",
+                (file_name, query, json.dumps(tracks, separators=(',', ':')))
+            )
+
+    async def get_playlist(self, file_name) -> tuple:
+        """Returns the stored fingerprint and a dict of resolved lines for a playlist file."""
+        async with self.lock:
+            return await self.loop.run_in_executor(None, self._fetch_playlist, file_name)
+
+    async def put_playlist(self, file_name, fingerprint: tuple, lines: dict) -> None:
+        """Replaces all resolved lines of a playlist file and updates its fingerprint."""
+        async with self.lock:
+            await self.loop.run_in_executor(None, self._store_playlist, file_name, fingerprint, lines)
+
+    async def put_line(self, file_name, query: str, tracks: list) -> None:
+        """Stores a single resolved line, without touching the file fingerprint."""
+        async with self.lock:
+            await self.loop.run_in_executor(None, self._store_line, file_name, query, tracks)
+
+    def close(self):
+        self._db.close()
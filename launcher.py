@@ -0,0 +1,284 @@
+"""
+Runs the bot as a cluster of processes on one host, each owning a range of shards.
+
+The launcher spawns the workers, restarts them when they crash or stop reporting
+their health, relays the messages between them and elects the leader, which runs
+the scheduled jobs (programme schedule, stats writes) for the whole cluster.
+The resolved playlist tracks are shared through the track cache file.
+
+Usage: python launcher.py
+Configuration: SHARD_COUNT and CLUSTER_COUNT in bot_config.py
+"""
+import os
+import json
+import time
+import signal
+import asyncio
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+
+import discord
+
+import bot_config
+
+# Restart a worker that did not report its health for this long, in seconds
+HEALTH_TIMEOUT = 90
+# Time for a worker to log in before its health is checked, in seconds
+STARTUP_GRACE = 180
+# Max. delay before restarting a crashed worker, in seconds
+MAX_RESTART_DELAY = 60
+# A worker running this long is considered stable again, in seconds
+STABLE_UPTIME = 300
+# How often to write the cluster health, in seconds
+HEALTH_REPORT_INTERVAL = 60
+HEALTH_REPORT_FILE_PATH = 'cluster_health.json'
+
+
+def run_cluster(cluster_id: int, shard_ids: list, shard_count: int, connection) -> None:
+    # Imported here, so the launcher itself does not load the bot
+    from bot import BotClient
+
+    bot = BotClient(
+        cluster_id=cluster_id,
+        cluster_connection=connection,
+        shard_ids=shard_ids,
+        shard_count=shard_count
+    )
+    bot.run()
+
+
+async def fetch_recommended_shard_count() -> int:
+    http = discord.http.HTTPClient()
+    try:
+        await http.static_login(bot_config.BOT_AUTH_TOKEN, bot=True)
+        shard_count, _ = await http.get_bot_gateway()
+    finally:
+        await http.close()
+
+    return shard_count
+
+
+def split_shards(shard_count: int, cluster_count: int) -> list:
+    """Returns a list of contiguous shard id ranges, one per cluster"""
+    cluster_count = max(1, min(cluster_count, shard_count))
+    size, extra = divmod(shard_count, cluster_count)
+
+    clusters, start = [], 0
+    for cluster_id in range(cluster_count):
+        end = start + size + (1 if cluster_id < extra else 0)
+        clusters.append(list(range(start, end)))
+        start = end
+
+    return clusters
+
+
+class Worker:
+    __slots__ = ('cluster_id', 'shard_ids', 'process', 'connection', 'started', 'crashes', 'restart_at', 'health')
+
+    def __init__(self, cluster_id: int, shard_ids: list) -> None:
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.process = None
+        self.connection = None
+        self.started = 0
+        self.crashes = 0
+        # Monotonic time to start the worker again at, when it is not running
+        self.restart_at = 0
+        # Last health report, with the monotonic time it came at
+        self.health = None
+
+    @property
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class Launcher:
+    def __init__(self, shard_count: int, cluster_count: int, log) -> None:
+        self.shard_count = shard_count
+        self.log = log
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = [
+            Worker(cluster_id, shard_ids)
+            for cluster_id, shard_ids in enumerate(split_shards(shard_count, cluster_count))
+        ]
+        self.leader_id = None
+        self.stopping = False
+        self.last_report = time.monotonic()
+
+    def start_worker(self, worker: Worker) -> None:
+        connection, worker_connection = self.context.Pipe()
+        worker.process = self.context.Process(
+            target=run_cluster,
+            args=(worker.cluster_id, worker.shard_ids, self.shard_count, worker_connection),
+            name=f'radiobot-cluster{worker.cluster_id}'
+        )
+        worker.process.start()
+        worker_connection.close()
+
+        worker.connection = connection
+        worker.started = time.monotonic()
+        worker.health = None
+        self.log.info(f"Started cluster {worker.cluster_id} with shards {worker.shard_ids}")
+
+        if self.leader_id is not None:
+            self.send(worker, {'op': 'leader', 'cluster_id': self.leader_id})
+
+    def stop_worker(self, worker: Worker, crashed: bool) -> None:
+        if worker.process.is_alive():
+            worker.process.terminate()
+            worker.process.join(10)
+            if worker.process.is_alive():
+                worker.process.kill()
+
+        worker.connection.close()
+        worker.process, worker.connection, worker.health = None, None, None
+
+        if crashed:
+            if time.monotonic() - worker.started > STABLE_UPTIME:
+                worker.crashes = 0
+            delay = min(2 ** worker.crashes, MAX_RESTART_DELAY)
+            worker.crashes += 1
+            worker.restart_at = time.monotonic() + delay
+            self.log.error(f"Cluster {worker.cluster_id} stopped, restarting in {delay} seconds")
+
+        if worker.cluster_id == self.leader_id:
+            self.elect_leader()
+
+    def send(self, worker: Worker, message: dict) -> None:
+        try:
+            worker.connection.send(message)
+        except (OSError, ValueError):
+            self.log.error(f"Could not send {message['op']} to cluster {worker.cluster_id}")
+
+    def elect_leader(self) -> None:
+        # The first worker that is up and reporting
+        candidates = [worker for worker in self.workers if worker.is_running and worker.health]
+        leader_id = candidates[0].cluster_id if candidates else None
+        if leader_id == self.leader_id:
+            return
+
+        self.leader_id = leader_id
+        self.log.info(f"Cluster {leader_id} is the leader now")
+        for worker in candidates:
+            self.send(worker, {'op': 'leader', 'cluster_id': leader_id})
+
+    def handle_message(self, sender: Worker, message: dict) -> None:
+        op = message['op']
+        if op == 'health':
+            sender.health = dict(message, received=time.monotonic())
+            if self.leader_id is None:
+                self.elect_leader()
+        elif op == 'broadcast':
+            for worker in self.workers:
+                if worker is not sender and worker.is_running:
+                    self.send(worker, message['message'])
+        elif op == 'to_leader':
+            leader = self.workers[self.leader_id] if self.leader_id is not None else None
+            if leader and leader.is_running:
+                self.send(leader, message['message'])
+            else:
+                self.log.warning(f"No leader for {message['message']['op']} from cluster {sender.cluster_id}")
+
+    def check_health(self, now: float) -> None:
+        for worker in self.workers:
+            if not worker.is_running:
+                continue
+
+            last_seen = worker.health['received'] if worker.health else worker.started + STARTUP_GRACE - HEALTH_TIMEOUT
+            if now - last_seen > HEALTH_TIMEOUT:
+                self.log.error(f"Cluster {worker.cluster_id} stopped reporting, restarting it")
+                self.stop_worker(worker, crashed=True)
+
+    def report_health(self) -> None:
+        clusters = {}
+        for worker in self.workers:
+            health = worker.health or {}
+            clusters[worker.cluster_id] = {
+                'running': worker.is_running,
+                'ready': health.get('ready', False),
+                'shards_up': sum(health.get('shards', {}).values()),
+                'shards': len(worker.shard_ids),
+                'guilds': health.get('guilds', 0),
+                'players': health.get('players', 0),
+                'latency': health.get('latency'),
+                'crashes': worker.crashes
+            }
+
+        summary = {
+            'leader': self.leader_id,
+            'shards_up': sum(cluster['shards_up'] for cluster in clusters.values()),
+            'shards': self.shard_count,
+            'guilds': sum(cluster['guilds'] for cluster in clusters.values()),
+            'players': sum(cluster['players'] for cluster in clusters.values()),
+            'clusters': clusters
+        }
+        self.log.info(
+            f"Cluster health: {summary['shards_up']}/{summary['shards']} shards up, "
+            f"{summary['guilds']} guilds, {summary['players']} players, leader {summary['leader']}"
+        )
+
+        with open(HEALTH_REPORT_FILE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4)
+
+    def stop(self, *args) -> None:
+        self.stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        while not self.stopping:
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.process is not None and not worker.process.is_alive():
+                    # Died without us noticing the sentinel
+                    self.stop_worker(worker, crashed=True)
+                if worker.process is None and now >= worker.restart_at:
+                    self.start_worker(worker)
+
+            # Including the ones that die meanwhile, their sentinels are ready then
+            started = [worker for worker in self.workers if worker.process is not None]
+            ready = wait(
+                [worker.connection for worker in started] + [worker.process.sentinel for worker in started],
+                timeout=1
+            )
+
+            for worker in started:
+                if worker.process.sentinel in ready:
+                    self.stop_worker(worker, crashed=True)
+                    continue
+
+                try:
+                    while worker.connection.poll():
+                        self.handle_message(worker, worker.connection.recv())
+                except (EOFError, OSError):
+                    # Will be noticed by the sentinel
+                    pass
+
+            now = time.monotonic()
+            self.check_health(now)
+            if now - self.last_report >= HEALTH_REPORT_INTERVAL:
+                self.last_report = now
+                self.report_health()
+
+        self.log.info("Stopping the clusters")
+        for worker in self.workers:
+            if worker.process is not None:
+                self.stop_worker(worker, crashed=False)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s %(name)s/%(levelname)s] %(message)s")
+    log = logging.getLogger("radiobot.launcher")
+
+    shard_count = getattr(bot_config, 'SHARD_COUNT', None)
+    if not shard_count:
+        shard_count = asyncio.run(fetch_recommended_shard_count())
+
+    cluster_count = getattr(bot_config, 'CLUSTER_COUNT', None) or os.cpu_count() or 1
+    Launcher(shard_count, cluster_count, log).run()
+
+
+if __name__ == "__main__":
+    main()
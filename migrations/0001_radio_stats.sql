@@ -0,0 +1,16 @@
+-- Lifetime stats per user in a guild.
+-- Fixes the first schema.sql version, which declared two primary keys.
+CREATE TABLE IF NOT EXISTS radio_stats(
+    user_id bigint NOT NULL,
+    guild_id bigint NOT NULL,
+    listening_minutes integer NOT NULL DEFAULT 0,
+    song_requests integer NOT NULL DEFAULT 0
+);
+
+UPDATE radio_stats SET listening_minutes = 0 WHERE listening_minutes IS NULL;
+UPDATE radio_stats SET song_requests = 0 WHERE song_requests IS NULL;
+ALTER TABLE radio_stats ALTER COLUMN listening_minutes SET NOT NULL;
+ALTER TABLE radio_stats ALTER COLUMN song_requests SET NOT NULL;
+
+ALTER TABLE radio_stats DROP CONSTRAINT IF EXISTS radio_stats_pkey;
+ALTER TABLE radio_stats ADD CONSTRAINT radio_stats_pkey PRIMARY KEY (user_id, guild_id);
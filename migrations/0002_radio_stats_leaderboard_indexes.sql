@@ -0,0 +1,6 @@
+-- Leaderboards read the top rows of a guild from these
+CREATE INDEX IF NOT EXISTS radio_stats_guild_minutes_idx
+    ON radio_stats (guild_id, listening_minutes DESC);
+
+CREATE INDEX IF NOT EXISTS radio_stats_guild_requests_idx
+    ON radio_stats (guild_id, song_requests DESC);
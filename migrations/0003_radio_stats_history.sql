@@ -0,0 +1,29 @@
+-- Stats per hour, partitioned by month.
+-- The partitions are created and dropped by the bot, see cogs/utils/history.py
+CREATE TABLE radio_stats_hourly(
+    bucket timestamptz NOT NULL,
+    user_id bigint NOT NULL,
+    guild_id bigint NOT NULL,
+    listening_minutes integer NOT NULL DEFAULT 0,
+    song_requests integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id, bucket)
+) PARTITION BY RANGE (bucket);
+
+-- Rollups of the hourly stats, kept after the hourly partitions are dropped
+CREATE TABLE radio_stats_weekly(
+    week date NOT NULL,
+    user_id bigint NOT NULL,
+    guild_id bigint NOT NULL,
+    listening_minutes integer NOT NULL DEFAULT 0,
+    song_requests integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, week, user_id)
+);
+
+CREATE TABLE radio_stats_monthly(
+    month date NOT NULL,
+    user_id bigint NOT NULL,
+    guild_id bigint NOT NULL,
+    listening_minutes integer NOT NULL DEFAULT 0,
+    song_requests integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, month, user_id)
+);
@@ -0,0 +1,17 @@
+-- Listener-seconds per day of what was on air
+CREATE TABLE radio_programme_listening(
+    day date NOT NULL,
+    guild_id bigint NOT NULL,
+    programme text NOT NULL,
+    listening_seconds bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, day, programme)
+);
+
+CREATE TABLE radio_track_listening(
+    day date NOT NULL,
+    guild_id bigint NOT NULL,
+    track_identifier text NOT NULL,
+    track_title text,
+    listening_seconds bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, day, track_identifier)
+);